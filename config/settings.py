@@ -5,6 +5,7 @@ Production-ready settings.
 
 from pathlib import Path
 import os
+import queue
 from dotenv import load_dotenv
 
 # --------------------------------------------------
@@ -13,7 +14,10 @@ from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-load_dotenv(BASE_DIR / ".env")
+# In production the variables come from the real environment
+# (systemd / docker); .env is only parsed for local development.
+if os.getenv("DJANGO_ENV") != "production":
+    load_dotenv(BASE_DIR / ".env")
 
 # --------------------------------------------------
 # Security
@@ -99,6 +103,8 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD", "secret_password"),
         "HOST": "localhost",
         "PORT": "5433",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
         "OPTIONS": {
             "client_encoding": "UTF8",
         },
@@ -136,6 +142,10 @@ STATIC_ROOT = Path("/var/www/stt_project/staticfiles")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Large uploads are streamed to disk here while the body is read. Being on
+# MEDIA_ROOT's filesystem, storing the file is a rename instead of a copy.
+FILE_UPLOAD_TEMP_DIR = MEDIA_ROOT / "tmp"
+
 # --------------------------------------------------
 # Auth Redirects
 # --------------------------------------------------
@@ -155,6 +165,21 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = "Asia/Tehran"
 
+# Transcriptions run for minutes: take one task at a time and ack it
+# only when done, so queued files go to whichever worker is idle.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ACKS_LATE = True
+# Must exceed the longest transcription, or Redis redelivers it mid-run.
+CELERY_BROKER_TRANSPORT_OPTIONS = {"visibility_timeout": 6 * 60 * 60}
+# Long transcriptions and LLM summaries get their own queues so they can
+# be given dedicated workers; every queue needs a consumer (see README).
+CELERY_TASK_ROUTES = {
+    "core.tasks.process_audio_file": {"queue": "transcription"},
+    "core.tasks.summarize_audio_file": {"queue": "summaries"},
+}
+# Recycle children now and then to bound RSS drift from long tasks
+CELERY_WORKER_MAX_TASKS_PER_CHILD = 50
+
 # --------------------------------------------------
 # External API Tokens
 # --------------------------------------------------
@@ -168,6 +193,12 @@ DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_API_KEY")
 # Logging
 # --------------------------------------------------
 
+# Request threads only enqueue records; core.apps.start_log_listener()
+# drains the queue into LOG_FILE from a background thread. Bounded, so a
+# stalled disk drops records instead of growing memory without limit.
+LOG_FILE = BASE_DIR / "logs/debug.log"
+LOG_QUEUE = queue.Queue(maxsize=10000)
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
@@ -184,9 +215,8 @@ LOGGING = {
     "handlers": {
         "file": {
             "level": "INFO",
-            "class": "logging.FileHandler",
-            "filename": BASE_DIR / "logs/debug.log",
-            "formatter": "verbose",
+            "class": "core.apps.BoundedQueueHandler",
+            "queue": LOG_QUEUE,
         },
         "console": {
             "class": "logging.StreamHandler",
@@ -200,7 +230,7 @@ LOGGING = {
         },
         "core": {
             "handlers": ["file", "console"],
-            "level": "DEBUG",
+            "level": "DEBUG" if DEBUG else "INFO",
         },
         "celery": {
             "handlers": ["file", "console"],
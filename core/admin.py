@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.db.models import Count
 from .models import AudioFile
+from .templatetags.jalali_tags import to_jalali
 
 class AudioFileInline(admin.TabularInline):
     """
@@ -18,9 +20,13 @@ class UserAdmin(BaseUserAdmin):
     inlines = (AudioFileInline,)  
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'get_files_count')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(_files_count=Count("audiofile"))
+
     def get_files_count(self, obj):
-        return obj.audiofile_set.count()
+        return obj._files_count
     get_files_count.short_description = 'تعداد فایل‌ها'
+    get_files_count.admin_order_field = '_files_count'
 
 
 admin.site.unregister(User)
@@ -33,13 +39,14 @@ admin.site.register(User, UserAdmin)
 class AudioFileAdmin(admin.ModelAdmin):
 
     list_display = ('title', 'user', 'status', 'get_created_at_jalali')
+    list_select_related = ('user',)
+    raw_id_fields = ('user', 'import_batch')
     
-    list_filter = ('status', 'created_at', 'user') 
+    list_filter = ('status', 'created_at') 
     search_fields = ('title', 'transcript_text', 'user__username') 
     readonly_fields = ('created_at',)
 
     def get_created_at_jalali(self, obj):
-        from .templatetags.jalali_tags import to_jalali
         return to_jalali(obj.created_at)
     
     get_created_at_jalali.short_description = 'تاریخ ایجاد (شمسی)'
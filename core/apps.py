@@ -1,6 +1,92 @@
+import atexit
+import logging
+import os
+import queue
+import weakref
+from logging.handlers import QueueHandler, QueueListener
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+_log_listener = None
+_log_listener_pid = None
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that drops records while LOG_QUEUE is full."""
+
+    # So a forked child can point every handler at its own queue
+    instances = weakref.WeakSet()
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        BoundedQueueHandler.instances.add(self)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def start_log_listener():
+    """
+    Starts the background thread that writes queued log records
+    (settings.LOG_QUEUE) to settings.LOG_FILE.
+    Safe to call more than once; forked children (Celery prefork,
+    preloaded WSGI workers) get their own through the at-fork hook.
+    """
+    global _log_listener, _log_listener_pid
+
+    if _log_listener is not None and _log_listener_pid == os.getpid():
+        return
+
+    # Same format the LOGGING config declares, so the two can't drift
+    verbose = settings.LOGGING.get("formatters", {}).get("verbose", {})
+    handler = logging.FileHandler(settings.LOG_FILE, encoding="utf-8")
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(
+        logging.Formatter(verbose.get("format"), style=verbose.get("style", "%"))
+    )
+
+    if _log_listener is None:
+        atexit.register(_stop_log_listener)
+    _log_listener = QueueListener(settings.LOG_QUEUE, handler, respect_handler_level=True)
+    _log_listener_pid = os.getpid()
+    _log_listener.start()
+
+
+def _stop_log_listener():
+    # A child must not stop the listener it inherited: that one drains
+    # the parent's queue, whose lock may have been held at fork time.
+    if _log_listener is not None and _log_listener_pid == os.getpid():
+        _log_listener.stop()
+
+
+def _restart_log_listener_in_child():
+    """
+    The listener thread does not survive fork(). Give the child a fresh
+    queue before restarting it, so records queued before the fork aren't
+    written twice and a lock held by the parent's thread can't deadlock.
+    """
+    if _log_listener is None:
+        return
+
+    fresh = queue.Queue(maxsize=settings.LOG_QUEUE.maxsize)
+    settings.LOG_QUEUE = fresh
+    for handler in list(BoundedQueueHandler.instances):
+        handler.queue = fresh
+    start_log_listener()
+
+
+os.register_at_fork(after_in_child=_restart_log_listener_in_child)
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+        start_log_listener()
@@ -1,11 +1,17 @@
 # core/forms.py
 
 from django import forms
+from django.contrib.auth import password_validation
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.utils.translation import gettext_lazy as _
 from .models import AudioFile
 
 
+# Uploads with these extensions go through audio extraction first
+VIDEO_EXTS = (".mp4", ".mkv", ".avi", ".mov", ".webm")
+
+
 class AudioUploadForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
@@ -50,6 +56,9 @@ class AudioUploadForm(forms.ModelForm):
         if self.user:
             instance.user = self.user
 
+        # Known from the upload's name, so it goes out with the same save
+        instance.is_video = (instance.audio_file.name or "").lower().endswith(VIDEO_EXTS)
+
         if commit:
             instance.save()
 
@@ -58,6 +67,27 @@ class AudioUploadForm(forms.ModelForm):
 
 
 class SignUpForm(UserCreationForm):
+
+    # Redeclared from UserCreationForm: Meta.widgets doesn't reach them
+    password1 = forms.CharField(
+        label=_("Password"),
+        strip=False,
+        widget=forms.PasswordInput(attrs={
+            'class': 'form-control',
+            'autocomplete': 'new-password',
+        }),
+        help_text=password_validation.password_validators_help_text_html(),
+    )
+    password2 = forms.CharField(
+        label=_("Password confirmation"),
+        strip=False,
+        widget=forms.PasswordInput(attrs={
+            'class': 'form-control',
+            'autocomplete': 'new-password',
+        }),
+        help_text=_("Enter the same password as before, for verification."),
+    )
+
     class Meta:
         model = User
         fields = ['username', 'email']
@@ -68,12 +98,13 @@ class SignUpForm(UserCreationForm):
         help_texts = {
             'username': 'نام کاربری باید انگلیسی باشد.',
         }
+        widgets = {
+            'username': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'مثلاً: ali_reza'
+            }),
+            'email': forms.EmailInput(attrs={
+                'class': 'form-control',
+            }),
+        }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        for field_name in self.fields:
-            self.fields[field_name].widget.attrs.update({'class': 'form-control'})
-
-            if field_name == 'username':
-                self.fields[field_name].widget.attrs['placeholder'] = 'مثلاً: ali_reza'
@@ -0,0 +1,27 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('core', '0009_alter_importbatch_source_url_and_more'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='audiofile',
+            index=models.Index(fields=['user', '-created_at'], name='audiofile_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='audiofile',
+            index=models.Index(fields=['status'], name='audiofile_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='audiofile',
+            index=models.Index(fields=['task_id'], name='audiofile_task_id_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import Min
+from django.db.models.functions import MD5
+
+
+def delete_duplicate_items(apps, schema_editor):
+    # Older discovery runs checked for existing URLs one at a time and could
+    # race, so keep only the first row of each (batch, source_url) pair.
+    ImportItem = apps.get_model('core', 'ImportItem')
+    duplicates = (
+        ImportItem.objects.values('batch', 'source_url')
+        .annotate(keep_id=Min('id'), n=models.Count('id'))
+        .filter(n__gt=1)
+    )
+    for row in duplicates.iterator():
+        ImportItem.objects.filter(
+            batch_id=row['batch'], source_url=row['source_url'],
+        ).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_audiofile_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='importitem',
+            constraint=models.UniqueConstraint(models.F('batch'), MD5('source_url'), name='importitem_batch_url_md5_uniq'),
+        ),
+    ]
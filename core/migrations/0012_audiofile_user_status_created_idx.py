@@ -0,0 +1,19 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction.
+    atomic = False
+
+    dependencies = [
+        ('core', '0011_importitem_batch_url_uniq'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='audiofile',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='af_user_status_created_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import MD5
 from django.contrib.auth.models import User
 import os
 
@@ -84,14 +85,6 @@ class AudioFile(models.Model):
         COMPLETED = 'completed', 'تکمیل شده'
         FAILED = 'failed', 'خطا'
 
-    # ==============================
-    # Speech-to-text model choices
-    # ==============================
-    class ModelChoices(models.TextChoices):
-        EBOO = 'eboo', 'Eboo'
-        VIRA = 'vira', 'Vira'
-        SCRIBE = 'scribe', 'Scribe'
-
     # ==============================
     # Owner
     # ==============================
@@ -203,6 +196,12 @@ class AudioFile(models.Model):
         ordering = ['-created_at']
         verbose_name = "فایل پردازشی"
         verbose_name_plural = "فایل‌های پردازشی"
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='audiofile_user_created_idx'),
+            models.Index(fields=['status'], name='audiofile_status_idx'),
+            models.Index(fields=['task_id'], name='audiofile_task_id_idx'),
+            models.Index(fields=['user', 'status', 'created_at'], name='af_user_status_created_idx'),
+        ]
 
     def __str__(self):
         return self.title or f"File #{self.id}"
@@ -256,6 +255,28 @@ class ImportItem(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # On the URL's hash: a btree over the raw TextField rejects
+            # rows over ~2.7 KB, and signed media URLs can be that long.
+            models.UniqueConstraint(models.F('batch'), MD5('source_url'), name='importitem_batch_url_md5_uniq'),
+        ]
+
     def __str__(self):
         return self.title or self.source_url
+
+    @classmethod
+    def bulk_from_discovery(cls, batch, items):
+        """
+        Inserts discovered items (dicts of ImportItem field values)
+        for a batch in one query instead of one INSERT per item.
+        URLs already in the batch are skipped by the unique constraint,
+        so the returned objects may include rows that were not inserted;
+        count batch.items for the real number.
+        """
+        return cls.objects.bulk_create(
+            [cls(batch=batch, **item) for item in items],
+            batch_size=500,
+            ignore_conflicts=True
+        )
     
\ No newline at end of file
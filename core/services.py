@@ -1,15 +1,105 @@
 # core/services.py
 import json
 import time
+import orjson
+import numpy as np
 import requests
 import os
+import mmap
+import re
+import struct
 import subprocess
 import uuid
+import wave
 import tempfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from django.conf import settings
-from django.contrib.sites.models import Site
 from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+
+def _multipart(fields: dict, file_field: str, filename: str, fileobj, content_type: str):
+    """
+    Builds a streaming multipart body -> (data, content_type header).
+
+    Regular files go through MultipartEncoder (known Content-Length).
+    Pipes (e.g. ffmpeg stdout) have no length, so the body is produced
+    by a generator and requests sends it with chunked transfer encoding.
+    """
+    if fileobj.seekable():
+        form = MultipartEncoder(fields={**fields, file_field: (filename, fileobj, content_type)})
+        return form, form.content_type
+
+    boundary = uuid.uuid4().hex
+
+    def body():
+        for name, value in fields.items():
+            yield (
+                f'--{boundary}\r\n'
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f'{value}\r\n'
+            ).encode()
+        yield (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode()
+        while chunk := fileobj.read(65536):
+            yield chunk
+        yield f'\r\n--{boundary}--\r\n'.encode()
+
+    return body(), f"multipart/form-data; boundary={boundary}"
+
+
+# API tokens never change during a worker's lifetime; resolve them once.
+EBOO_TOKEN = getattr(settings, "EBOO_TOKEN", None)
+SCRIBE_TOKEN = getattr(settings, "SCRIBE_TOKEN", None)
+VIRA_TOKEN = getattr(settings, "VIRA_TOKEN", None)
+
+
+def _build_session() -> requests.Session:
+    """
+    Keep-alive session with a connection pool, so polling loops and
+    repeated uploads reuse TCP/TLS connections instead of reconnecting.
+    """
+    session = requests.Session()
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=64,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# One pool shared by every outbound call in this module.
+_SESSION = _build_session()
+
+
+def _poll_delays(timeout: float, initial: float = 1.0, factor: float = 1.5, cap: float = 10.0):
+    """
+    Exponential backoff delays (1s, 1.5s, 2.25s ... capped at `cap`)
+    until `timeout` seconds of wall-clock time have passed, including
+    the time spent in the poll requests themselves.
+    """
+    deadline = time.monotonic() + timeout
+    delay = initial
+    while (remaining := deadline - time.monotonic()) > 0:
+        yield min(delay, remaining)
+        delay = min(delay * factor, cap)
 
 
 
@@ -30,7 +120,58 @@ import os
 from django.conf import settings
 
 
+def _wav_pcm_layout(path: str):
+    # Walks the RIFF chunk headers only (ffmpeg also writes a LIST chunk
+    # before "data"). Returns (data_offset, data_size, channels,
+    # sample_rate, bits) for PCM files, None for anything else.
+    with open(path, "rb") as f:
+        hdr = f.read(12)
+        if len(hdr) < 12 or hdr[0:4] != b"RIFF" or hdr[8:12] != b"WAVE":
+            return None
+
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            cid, size = struct.unpack("<4sI", chunk)
+
+            if cid == b"fmt ":
+                body = f.read(size)
+                if len(body) < 16:
+                    return None
+                fmt = struct.unpack_from("<HHIIHH", body)
+            elif cid == b"data":
+                if fmt is None:
+                    return None
+                tag, ch, sr, _, _, bits = fmt
+                if tag not in (1, 0xFFFE) or not ch or not sr or bits < 8:
+                    return None
+                offset = f.tell()
+                remain = os.path.getsize(path) - offset
+                data_size = size if 0 < size <= remain else remain
+                return offset, data_size, ch, sr, bits
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+def _wav_duration_fast(path: str):
+    layout = _wav_pcm_layout(path)
+    if layout is None:
+        return None
+    _, data_size, ch, sr, bits = layout
+    return data_size / (sr * ch * (bits // 8))
+
+
 def get_audio_duration(path: str) -> float:
+    if path.lower().endswith(".wav"):
+        try:
+            dur = _wav_duration_fast(path)
+        except OSError:
+            dur = None
+        if dur is not None:
+            return dur
+
     cmd = [
         "ffprobe",
         "-v", "error",
@@ -47,28 +188,40 @@ def get_audio_duration(path: str) -> float:
 
 class EbooService:
     BASE_URL = "https://www.eboo.ir/api/ocr/getway"
+    POLL_TIMEOUT = 120
 
     @staticmethod
     def process(file_path: str):
-        token = getattr(settings, "EBOO_TOKEN", None)
-        if not token:
-            return {"error": "EBOO_TOKEN missing in settings"}
-
         if not os.path.exists(file_path):
             return {"error": "File not found"}
 
         with open(file_path, "rb") as f:
-            files = {"filehandle": f}
-            data = {
-                "token": token,
-                "command": "addfile"
-            }
-            r = requests.post(EbooService.BASE_URL, data=data, files=files)
+            return EbooService.process_stream(f, os.path.basename(file_path))
+
+    @staticmethod
+    def process_stream(fileobj, filename: str):
+        token = EBOO_TOKEN
+        if not token:
+            return {"error": "EBOO_TOKEN missing in settings"}
+
+        body, content_type = _multipart(
+            {"token": token, "command": "addfile"},
+            "filehandle", filename, fileobj, "application/octet-stream"
+        )
+        try:
+            r = _SESSION.post(
+                EbooService.BASE_URL,
+                data=body,
+                headers={"Content-Type": content_type},
+                timeout=(5, 900)
+            )
+        except requests.RequestException as e:
+            return {"exception": f"Eboo addfile error: {e}"}
 
         if r.status_code != 200:
             return {"error": f"Eboo addfile failed: {r.text}"}
 
-        res = r.json()
+        res = orjson.loads(r.content)
         file_token = res.get("FileToken") or res.get("filetoken")
         if not file_token:
             return {"error": "Eboo addfile: file token missing"}
@@ -81,23 +234,35 @@ class EbooService:
             "language": "fa"
         }
 
-        r2 = requests.post(EbooService.BASE_URL, json=data2)
+        try:
+            r2 = _SESSION.post(EbooService.BASE_URL, json=data2, timeout=(5, 60))
+        except requests.RequestException as e:
+            return {"exception": f"Eboo convert error: {e}"}
         if r2.status_code != 200:
             return {"error": f"Eboo convert failed: {r2.text}"}
 
-        for _ in range(60):  
-            time.sleep(2)
-            check = {
-                "token": token,
-                "command": "checkconvert",
-                "filetoken": file_token
-            }
-            r3 = requests.post(EbooService.BASE_URL, json=check)
+        check = {
+            "token": token,
+            "command": "checkconvert",
+            "filetoken": file_token
+        }
+
+        deadline = time.monotonic() + EbooService.POLL_TIMEOUT
+        for delay in _poll_delays(EbooService.POLL_TIMEOUT):
+            time.sleep(delay)
+            # A hung poll must not outlive the polling deadline
+            read_timeout = max(deadline - time.monotonic(), 1.0)
+            try:
+                r3 = _SESSION.post(
+                    EbooService.BASE_URL, json=check, timeout=(5, read_timeout)
+                )
+            except requests.RequestException:
+                continue
             if r3.status_code != 200:
                 continue
 
             try:
-                js = r3.json()
+                js = orjson.loads(r3.content)
             except Exception:
                 continue
 
@@ -122,33 +287,61 @@ import time
 import requests
 from django.conf import settings
 
+_SCRIBE_PAYLOAD = {
+    "model": {
+        "name": "elevenlabs",
+        "model": "scribe_v1"
+    },
+    "operation": "STT",
+}
+
+# The generate endpoint has accepted the audio URL under several names;
+# all of them are sent until the API contract is pinned down.
+_SCRIBE_URL_ARGS = ("url", "audio_url", "file", "audio", "source", "file_url")
+
+
 class ScribeService:
     STORAGE_URL = "https://api.metisai.ir/api/v1/storage"
     GENERATE_URL = "https://api.metisai.ir/api/v2/generate"
+    POLL_TIMEOUT = 300
 
     @classmethod
     def process(cls, file_path: str):
-        token = getattr(settings, "SCRIBE_TOKEN", None)
-        if not token:
-            return {"error": "SCRIBE_TOKEN missing in settings"}
-        
         if not os.path.exists(file_path):
             return {"error": f"File not found: {file_path}"}
 
+        try:
+            with open(file_path, "rb") as f:
+                return cls.process_stream(f, os.path.basename(file_path))
+        except OSError as e:
+            return {"exception": f"Upload error: {e}"}
+
+    @classmethod
+    def process_stream(cls, fileobj, filename: str):
+        token = SCRIBE_TOKEN
+        if not token:
+            return {"error": "SCRIBE_TOKEN missing in settings"}
+
         headers = {"Authorization": f"Bearer {token}"}
 
         try:
-            with open(file_path, "rb") as f:
-                files = {"files": (os.path.basename(file_path), f)}
-                print(f"[SCRIBE] Uploading file: {file_path}")
-                upload = requests.post(cls.STORAGE_URL, headers=headers, files=files, timeout=900)
+            body, content_type = _multipart(
+                {}, "files", filename, fileobj, "application/octet-stream"
+            )
+            print(f"[SCRIBE] Uploading file: {filename}")
+            upload = _SESSION.post(
+                cls.STORAGE_URL,
+                headers={**headers, "Content-Type": content_type},
+                data=body,
+                timeout=900
+            )
         except Exception as e:
             return {"exception": f"Upload error: {e}"}
 
         if upload.status_code not in (200, 201):
             return {"error": f"Upload failed: {upload.text}"}
 
-        up_json = upload.json()
+        up_json = orjson.loads(upload.content)
         files_list = up_json.get("files")
         if not files_list or not isinstance(files_list, list) or not files_list[0].get("url"):
             return {"error": "No audio_url returned", "raw": up_json}
@@ -156,33 +349,34 @@ class ScribeService:
         audio_url = files_list[0]["url"]
         print(f"[SCRIBE] File uploaded. URL obtained.")
         
-        time.sleep(2) 
+        # Wait (at most the old fixed 2s) until storage serves the file.
+        for delay in _poll_delays(2.0, initial=0.01, factor=4.0, cap=1.0):
+            try:
+                if _SESSION.head(audio_url, timeout=5, allow_redirects=True).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            time.sleep(delay)
 
         payload = {
-            "model": {
-                "name": "elevenlabs",
-                "model": "scribe_v1"
-            },
-            "operation": "STT",
-            "args": {
-                "url": audio_url,
-                "audio_url": audio_url,
-                "file": audio_url,
-                "audio": audio_url,
-                "source": audio_url,
-                "file_url": audio_url
-            }
+            **_SCRIBE_PAYLOAD,
+            "args": dict.fromkeys(_SCRIBE_URL_ARGS, audio_url),
         }
 
         try:
-            gen_resp = requests.post(cls.GENERATE_URL, headers=headers, json=payload, timeout=900)
+            gen_resp = _SESSION.post(
+                cls.GENERATE_URL,
+                headers={**headers, "Content-Type": "application/json"},
+                data=orjson.dumps(payload),
+                timeout=900
+            )
         except Exception as e:
             return {"exception": f"Generate error: {e}"}
 
         if gen_resp.status_code not in (200, 201):
             return {"error": f"Generate failed: {gen_resp.text}"}
 
-        gen_json = gen_resp.json()
+        gen_json = orjson.loads(gen_resp.content)
         task_id = gen_json.get("id")
         if not task_id:
             return {"error": "No task ID returned", "raw": gen_json}
@@ -190,11 +384,11 @@ class ScribeService:
         print(f"[SCRIBE] Task started. ID: {task_id}")
         poll_url = f"{cls.GENERATE_URL}/{task_id}"
 
-        for attempt in range(60): 
+        for delay in _poll_delays(cls.POLL_TIMEOUT):
             try:
-                poll_resp = requests.get(poll_url, headers=headers, timeout=900)
+                poll_resp = _SESSION.get(poll_url, headers=headers, timeout=(5, 300))
                 if poll_resp.status_code == 200:
-                    js = poll_resp.json()
+                    js = orjson.loads(poll_resp.content)
                     status = js.get("status")
                     
                     if status == "COMPLETED":
@@ -207,9 +401,10 @@ class ScribeService:
                                 result_url = first_gen.get("url")
                                 print(f"[SCRIBE] Result is a file link, downloading content from: {result_url}")
                                 try:
-                                    txt_resp = requests.get(result_url)
-                                    txt_resp.encoding = 'utf-8' 
-                                    final_text = txt_resp.text.strip().strip('"')
+                                    with _SESSION.get(result_url, stream=True, timeout=300) as txt_resp:
+                                        final_text = b"".join(
+                                            txt_resp.iter_content(chunk_size=65536)
+                                        ).decode("utf-8", "replace").strip().strip('"')
                                 except Exception as dl_err:
                                     return {"error": f"Failed to download result text: {dl_err}"}
 
@@ -223,10 +418,10 @@ class ScribeService:
                     elif status == "ERROR":
                         return {"error": "SCRIBE task failed", "raw": js}
                 
-                time.sleep(5)
+                time.sleep(delay)
             except Exception as e:
                 print(f"[SCRIBE] Polling error: {e}")
-                time.sleep(5)
+                time.sleep(delay)
 
         return {"error": "Timeout waiting for Scribe result"}
 
@@ -248,19 +443,23 @@ class ViraService:
 
     @staticmethod
     def process(file_path: str):
-        token = getattr(settings, "VIRA_TOKEN", None)
-        if not token:
-            return {"error": "VIRA_TOKEN missing in settings"}
-
         if not os.path.exists(file_path):
             return {"error": f"File not found: {file_path}"}
 
+        with open(file_path, "rb") as f:
+            return ViraService.process_stream(f, os.path.basename(file_path))
+
+    @staticmethod
+    def process_stream(fileobj, filename: str):
+        token = VIRA_TOKEN
+        if not token:
+            return {"error": "VIRA_TOKEN missing in settings"}
+
         headers = {
             "gateway-token": token,
             "accept": "application/json"
         }
 
-        filename = os.path.basename(file_path)
         mime_type = "audio/wav"
         model_type = "telephony"   
 
@@ -276,23 +475,19 @@ class ViraService:
         }
 
         try:
-            with open(file_path, "rb") as f:
-                files = {
-                    "audio": (filename, f, mime_type)
-                }
+            body, content_type = _multipart(data, "audio", filename, fileobj, mime_type)
 
-                r = requests.post(
-                    ViraService.URL,
-                    data=data,
-                    files=files,
-                    headers=headers,
-                    timeout=900
-                )
+            r = _SESSION.post(
+                ViraService.URL,
+                data=body,
+                headers={**headers, "Content-Type": content_type},
+                timeout=900
+            )
 
             if r.status_code not in (200, 201):
                 return {"error": f"Vira failed: {r.text}"}
 
-            js = r.json()
+            js = orjson.loads(r.content)
 
         except requests.exceptions.RequestException as e:
             return {"exception": f"Request error: {e}"}
@@ -313,7 +508,7 @@ class ViraService:
                 segments = ai.get("segments")
                 if isinstance(segments, list):
                     text = " ".join(
-                        seg.get("text", "") for seg in segments if seg.get("text")
+                        t for seg in segments if (t := seg.get("text"))
                     )
                 elif "text" in ai:
                     text = ai.get("text")
@@ -326,6 +521,8 @@ class ViraService:
 
 FFMPEG_PATH = shutil.which("ffmpeg")
 
+_SILENCE_END_RE = re.compile(r"silence_end:\s*([0-9]+(?:\.[0-9]+)?)")
+
 if not FFMPEG_PATH:
     raise RuntimeError("ffmpeg not found on system PATH")
 
@@ -344,9 +541,11 @@ class MediaService:
 
         cmd = [
             "ffmpeg",
+            "-nostdin",
+            "-threads", "0",
             "-y",
             "-i", video_path,
-            "-vn",
+            "-vn", "-sn", "-dn",
             "-ac", "1",
             "-ar", "16000",
             "-acodec", "pcm_s16le",
@@ -361,6 +560,48 @@ class MediaService:
         )
 
         return output_path
+
+    @staticmethod
+    @contextmanager
+    def extract_audio_stream(video_path: str):
+        """
+        Same output as extract_audio, but ffmpeg writes the WAV to a pipe
+        which is yielded as a file object, so nothing touches the disk.
+        Raises CalledProcessError only if ffmpeg fails on a stream that
+        was read to the end. If the body raises or stops reading early,
+        ffmpeg is killed and reaped quietly, so its broken-pipe exit
+        never hides the caller's own error.
+        """
+        cmd = [
+            "ffmpeg",
+            "-nostdin",
+            "-threads", "0",
+            "-i", video_path,
+            "-vn", "-sn", "-dn",
+            "-ac", "1",
+            "-ar", "16000",
+            "-acodec", "pcm_s16le",
+            "-f", "wav",
+            "pipe:1"
+        ]
+
+        proc = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        fully_read = False
+        try:
+            yield proc.stdout
+            fully_read = proc.stdout.read(1) == b""
+        finally:
+            if not fully_read:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+
+        if fully_read and proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
     
     
     @staticmethod
@@ -370,10 +611,11 @@ class MediaService:
         min_chunk_sec: int = 60,
         silence_db: int = -35,
         silence_dur: float = 0.6
-    ) -> list[str]:
+    ) -> list[tuple[str, float]]:
         """
         Silence-aware audio chunking.
         Avoids cutting in the middle of sentences.
+        Returns (chunk_path, duration_seconds) pairs.
         """
 
         import subprocess
@@ -381,33 +623,39 @@ class MediaService:
         work_dir = os.path.dirname(input_path)
         base = os.path.splitext(os.path.basename(input_path))[0]
 
+        layout = None
+        if input_path.lower().endswith(".wav"):
+            try:
+                layout = _wav_pcm_layout(input_path)
+            except OSError:
+                layout = None
+
+        # Mono 16 kHz s16le (e.g. extract_audio output) needs no decoding
+        is_pcm16k = bool(layout) and layout[2:] == (1, 16000, 16)
+
         # --------------------------------------------------
         # 1. Detect silence
         # --------------------------------------------------
-        detect_cmd = [
-            "ffmpeg",
-            "-i", input_path,
-            "-af", f"silencedetect=noise={silence_db}dB:d={silence_dur}",
-            "-f", "null", "-"
-        ]
-
-        proc = subprocess.Popen(
-            detect_cmd,
-            stderr=subprocess.PIPE,
-            stdout=subprocess.DEVNULL,
-            text=True
-        )
+        if is_pcm16k:
+            silence_points = MediaService._pcm_silence_ends(
+                input_path, layout, silence_db, silence_dur
+            )
+        else:
+            detect_cmd = [
+                "ffmpeg",
+                "-i", input_path,
+                "-af", f"silencedetect=noise={silence_db}dB:d={silence_dur}",
+                "-f", "null", "-"
+            ]
 
-        silence_points = []
-        for line in proc.stderr:
-            if "silence_end" in line:
-                try:
-                    t = float(line.split("silence_end:")[1].split("|")[0].strip())
-                    silence_points.append(t)
-                except:
-                    pass
+            proc = subprocess.run(
+                detect_cmd,
+                stderr=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                text=True
+            )
 
-        proc.wait()
+            silence_points = [float(t) for t in _SILENCE_END_RE.findall(proc.stderr)]
 
         if not silence_points:
             return MediaService._time_split_fallback(input_path, max_chunk_sec)
@@ -418,13 +666,14 @@ class MediaService:
         cuts = []
         start = 0.0
 
+        # silencedetect reports in ascending order, so the latest
+        # silence inside [start + min_chunk_sec, sp] is sp itself.
+        min_len = max(max_chunk_sec, min_chunk_sec)
+
         for sp in silence_points:
-            if sp - start >= max_chunk_sec:
-                valid = [s for s in silence_points if start + min_chunk_sec <= s <= sp]
-                if valid:
-                    cut = valid[-1]
-                    cuts.append((start, cut))
-                    start = cut
+            if sp - start >= min_len:
+                cuts.append((start, sp))
+                start = sp
 
         
         total_duration = get_audio_duration(input_path)
@@ -441,21 +690,30 @@ class MediaService:
 
         # --------------------------------------------------
         # 3. Export chunks
+        # One ffmpeg pass cuts every chunk at the chosen points;
+        # chunk durations follow from the cut points themselves.
         # --------------------------------------------------
-        paths = []
+        if not cuts:
+            return []
 
-        for i, (s, e) in enumerate(cuts):
-            out = os.path.join(work_dir, f"{base}_chunk_{i:03d}.wav")
+        boundaries = [s for s, _ in cuts[1:]]
+        pattern = os.path.join(work_dir, f"{base}_chunk_%03d.wav")
+        ends = boundaries + [total_duration]
 
-            cmd = ["ffmpeg", "-y", "-i", input_path, "-ss", str(s)]
-            if e:
-                cmd += ["-to", str(e)]
+        if is_pcm16k:
+            # Each chunk is a plain byte range, no re-encode needed.
+            MediaService._slice_pcm_wav(input_path, layout, cuts, pattern)
+        else:
+            cmd = ["ffmpeg", "-y", "-i", input_path, "-f", "segment"]
+            if boundaries:
+                cmd += ["-segment_times", ",".join(str(b) for b in boundaries)]
 
             cmd += [
+                "-reset_timestamps", "1",
                 "-ac", "1",
                 "-ar", "16000",
                 "-acodec", "pcm_s16le",
-                out
+                pattern
             ]
 
             subprocess.run(
@@ -465,20 +723,73 @@ class MediaService:
                 check=True
             )
 
-            dur = get_audio_duration(out)
-            if dur < 1.0:
+        paths = []
+
+        for i, ((s, _), e) in enumerate(zip(cuts, ends)):
+            out = pattern % i
+            if e - s < 1.0:
                 try:
                     os.remove(out)
                 except:
                     pass
             else:
-                paths.append(out)
+                paths.append((out, e - s))
 
 
         return paths
 
     @staticmethod
-    def _time_split_fallback(path: str, sec: int) -> list[str]:
+    def _pcm_silence_ends(path: str, layout, silence_db: int, silence_dur: float) -> list[float]:
+        """
+        numpy equivalent of ffmpeg's silencedetect for mono s16le WAVs:
+        10 ms frames whose RMS stays under `silence_db` for at least
+        `silence_dur` seconds form a silence; returns their end times.
+        """
+        offset, data_size, _, sr, _ = layout
+        frame = sr // 100
+        block = 6000  # frames per pass (60 s), keeps float copies small
+        threshold = (32768.0 * 10 ** (silence_db / 20)) ** 2
+
+        with open(path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pcm = np.frombuffer(mm, dtype="<i2", count=data_size // 2, offset=offset)
+            n = len(pcm) // frame
+            quiet = np.empty(n, dtype=bool)
+            seg = None
+
+            for i in range(0, n, block):
+                j = min(i + block, n)
+                seg = pcm[i * frame:j * frame].astype(np.float32).reshape(-1, frame)
+                quiet[i:j] = np.einsum("ij,ij->i", seg, seg) / frame < threshold
+
+            del pcm, seg
+
+        edges = np.diff(np.concatenate(([False], quiet, [False])).astype(np.int8))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        long_enough = (ends - starts) >= silence_dur * 100
+
+        return (ends[long_enough] * frame / sr).tolist()
+
+    @staticmethod
+    def _slice_pcm_wav(path: str, layout, cuts, pattern: str):
+        offset, data_size, _, sr, _ = layout
+        frame = 2
+
+        with open(path, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i, (s, e) in enumerate(cuts):
+                b0 = offset + min(int(s * sr) * frame, data_size)
+                b1 = offset + (data_size if e is None else min(int(e * sr) * frame, data_size))
+
+                with wave.open(pattern % i, "wb") as w:
+                    w.setnchannels(1)
+                    w.setsampwidth(frame)
+                    w.setframerate(sr)
+                    w.writeframes(mm[b0:b1])
+
+    @staticmethod
+    def _time_split_fallback(path: str, sec: int) -> list[tuple[str, float]]:
         base = os.path.splitext(path)[0]
         dir_ = os.path.dirname(path)
         pattern = os.path.basename(base) + "_chunk_%03d.wav"
@@ -513,7 +824,7 @@ class MediaService:
                     pass
                 continue
 
-            chunks.append(full)
+            chunks.append((full, dur))
 
         return chunks
         
@@ -521,17 +832,39 @@ class MediaService:
         
     
 def download_temp_file(url: str, timeout=60) -> str:
-    response = requests.get(url, stream=True, timeout=timeout)
-    response.raise_for_status()
-
     suffix = os.path.splitext(urlparse(url).path)[1] or ".bin"
 
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    for chunk in response.iter_content(chunk_size=8192):
-        if chunk:
-            tmp.write(chunk)
-    tmp.close()
-    return tmp.name    
+    with _SESSION.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+
+        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+        try:
+            with tmp:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    if chunk:
+                        tmp.write(chunk)
+        except Exception:
+            os.remove(tmp.name)
+            raise
+
+    return tmp.name
+
+
+def iter_page(url: str, headers=None, max_bytes=20 * 1024 * 1024, timeout=(5, 20)):
+    """
+    Yield an HTML page in 64 KB blocks over the shared session so it can
+    be parsed while it downloads. Aborts past `max_bytes` (huge listings
+    would otherwise tie up a worker indefinitely).
+    """
+    with _SESSION.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+
+        total = 0
+        for chunk in response.iter_content(chunk_size=65536):
+            total += len(chunk)
+            if total > max_bytes:
+                raise ValueError(f"Page larger than {max_bytes} bytes: {url}")
+            yield chunk
 
 
 
@@ -584,12 +917,54 @@ class SummaryService:
     )
     MODEL = os.getenv("SUMMARY_MODEL", "gpt-4.1-nano")
     TIMEOUT = 60
+    # Longer transcripts are summarized per window, then once more
+    # over the partial summaries.
+    CHUNK_CHARS = int(os.getenv("SUMMARY_CHUNK_CHARS", "20000"))
+    MAX_WORKERS = 4
 
     @classmethod
     def summarize(cls, text: str) -> str:
         if not text or len(text.strip()) < 50:
             return ""
 
+        if len(text) <= cls.CHUNK_CHARS:
+            return cls._complete(text)
+
+        windows = cls._split(text, cls.CHUNK_CHARS)
+        with ThreadPoolExecutor(max_workers=min(cls.MAX_WORKERS, len(windows))) as ex:
+            partials = [p for p in ex.map(cls._complete, windows) if p]
+
+        if not partials:
+            return ""
+        if len(partials) == 1:
+            return partials[0]
+
+        joined = "\n\n".join(partials)
+        # Many windows can still add up to more than one request holds;
+        # only recurse while that shrinks the text, so it always ends.
+        if cls.CHUNK_CHARS < len(joined) < len(text):
+            return cls.summarize(joined)
+        return cls._complete(joined)
+
+    @staticmethod
+    def _split(text: str, size: int) -> list[str]:
+        # Prefer paragraph breaks (chunk texts are joined with blank
+        # lines), then spaces, so windows don't cut words in half.
+        windows = []
+        while len(text) > size:
+            cut = text.rfind("\n\n", 0, size)
+            if cut <= 0:
+                cut = text.rfind(" ", 0, size)
+            if cut <= 0:
+                cut = size
+            windows.append(text[:cut])
+            text = text[cut:].lstrip()
+        if text:
+            windows.append(text)
+        return windows
+
+    @classmethod
+    def _complete(cls, text: str) -> str:
         url = f"{cls.BASE_URL}/chat/completions"
 
         payload = {
@@ -619,7 +994,7 @@ class SummaryService:
         }
 
         try:
-            resp = requests.post(
+            resp = _SESSION.post(
                 url,
                 json=payload,
                 headers=headers,
@@ -627,7 +1002,7 @@ class SummaryService:
             )
             resp.raise_for_status()
 
-            data = resp.json()
+            data = orjson.loads(resp.content)
 
             return (
                 data["choices"][0]["message"]["content"].strip()
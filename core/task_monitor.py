@@ -1,20 +1,63 @@
 # core/task_monitor.py
 
-from celery.result import AsyncResult
+import logging
+from datetime import timedelta
+
+from celery import current_app
+from django.conf import settings
+from django.utils import timezone
+
 from .models import AudioFile
 
+logger = logging.getLogger("core")
+
+# A PROCESSING row may sit claimed in the broker queue (prefetch=1 means
+# it is in no worker's reserved list) until a worker frees up, and Redis
+# redelivers unacked tasks after the visibility timeout anyway. Only rows
+# untouched for longer than that are treated as lost.
+STUCK_AFTER = timedelta(
+    seconds=settings.CELERY_BROKER_TRANSPORT_OPTIONS.get("visibility_timeout", 3600)
+)
+
+
+def _live_task_ids():
+    """
+    Task ids any worker is running or holding (reserved / scheduled).
+    One broadcast per category instead of one result-backend lookup
+    per stuck row. Returns None if any category got no replies, since
+    an empty snapshot cannot be told apart from busy, silent workers.
+    """
+    inspect = current_app.control.inspect()
+    ids = set()
+
+    for category in (inspect.active(), inspect.reserved(), inspect.scheduled()):
+        if not category:
+            return None
+        for worker_tasks in category.values():
+            for t in worker_tasks:
+                # scheduled() wraps the task under "request"
+                ids.add(t.get("id") or t.get("request", {}).get("id"))
+
+    ids.discard(None)
+    return ids
+
+
 def check_and_recover_stuck_tasks():
     """
     This function detects stuck tasks that remained in 'processing'
     after Celery restart or crash. It recovers them back to 'pending'.
     """
 
-    stuck = AudioFile.objects.filter(status='processing', task_id__isnull=False)
-
-    for audio in stuck:
-        result = AsyncResult(audio.task_id)
+    live_ids = _live_task_ids()
+    if live_ids is None:
+        logger.warning("[RECOVER] No worker replied to inspect; skipping recovery.")
+        return
 
-        # If task is missing, revoked, or not found → recover
-        if result.state in ["PENDING", "REVOKED", "FAILURE"]:
-            audio.status = "pending"
-            audio.save()
+    # Not held by any worker and not claimed recently → lost, recover
+    AudioFile.objects.filter(
+        status=AudioFile.Status.PROCESSING,
+        task_id__isnull=False,
+        updated_at__lt=timezone.now() - STUCK_AFTER,
+    ).exclude(
+        task_id__in=live_ids,
+    ).update(status=AudioFile.Status.PENDING, updated_at=timezone.now())
@@ -1,23 +1,31 @@
 # core/tasks.py
 
 import logging
-import json
 import os
-import subprocess
+import re
+import threading
+from itertools import chain
+from subprocess import CalledProcessError
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from celery import shared_task
-import requests
-import yt_dlp
-from bs4 import BeautifulSoup
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils import uuid
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
 from urllib.parse import urljoin, urlparse
 
 
-from .models import AudioFile, ImportBatch, ImportItem
+from .models import AudioFile, ImportBatch, ImportItem, STTModelChoices
 from .services import (
     EbooService,
     ScribeService,
     ViraService,
     MediaService,
     download_temp_file,
+    iter_page,
+    get_audio_duration,
     SummaryService,
 )
 
@@ -33,14 +41,169 @@ HUMAN_ERRORS = {
 }
 
 MAX_CHUNK_SECONDS = {
-    AudioFile.ModelChoices.VIRA: 300,     # 5 minutes
-    AudioFile.ModelChoices.EBOO: 480,     # 8 minutes
-    AudioFile.ModelChoices.SCRIBE: 600,   # 10 minutes
+    STTModelChoices.VIRA: 300,     # 5 minutes
+    STTModelChoices.EBOO: 480,     # 8 minutes
+    STTModelChoices.SCRIBE: 600,   # 10 minutes
 }
 
+# Direct-link extensions accepted by discover_link's HTML fallback
+AUDIO_EXT = frozenset((".mp3", ".wav", ".ogg", ".m4a", ".wma", ".aac", ".flac"))
+VIDEO_EXT = frozenset((".mp4", ".mkv", ".webm", ".avi", ".mov", ".wmv", ".flv", ".3gp", ".m3u8"))
+MEDIA_EXT = AUDIO_EXT | VIDEO_EXT
+
+YDL_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'ignoreerrors': True,
+    'extract_flat': 'in_playlist', 
+    'skip_download': True,
+    'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+}
 
+# One YoutubeDL per worker process, built on first use (after fork):
+# constructing it loads every extractor, which is not free per task.
+# yt_dlp and lxml are imported lazily too, so transcription-only workers
+# never load them.
+_YDL = None
+_YDL_LOCK = threading.Lock()
+
+
+def _ydl_extract_info(url):
+    global _YDL
+    with _YDL_LOCK:
+        if _YDL is None:
+            import yt_dlp
+            _YDL = yt_dlp.YoutubeDL(dict(YDL_OPTS))
+        info = _YDL.extract_info(url, download=False)
+        # Playlist entries may be lazy; resolve them while holding the lock
+        if info and 'entries' in info:
+            info['entries'] = list(info['entries'])
+        return info
+
+
+_YDL_SITE_IES = None
+
+
+def _ydl_has_site_extractor(url):
+    """True when a dedicated yt-dlp extractor (not Generic) claims url."""
+    global _YDL_SITE_IES
+    if _YDL_SITE_IES is None:
+        from yt_dlp.extractor import gen_extractor_classes
+        _YDL_SITE_IES = [
+            ie for ie in gen_extractor_classes() if ie.ie_key() != "Generic"
+        ]
+    return any(ie.suitable(url) for ie in _YDL_SITE_IES)
+
+
+MEDIA_TAGS = ("audio", "video", "source", "a")
+MAX_SCRAPED_ITEMS = 1000
+
+
+def _scrape_events(parser, base_url):
+    """Media links from the tags the pull parser has seen so far."""
+    for _, tag in parser.read_events():
+        is_explicit_media_tag = tag.tag != "a"
+        src = tag.get("src") if is_explicit_media_tag else tag.get("href")
+
+        if not src:
+            continue
+
+        # Resolving against base_url doesn't change the extension, so
+        # check it on the raw href and only join the links we keep.
+        ext = os.path.splitext(urlparse(src).path)[1].lower()
+
+        if is_explicit_media_tag or ext in MEDIA_EXT:
+            file_url = urljoin(base_url, src)
+            path = urlparse(file_url).path
+
+            is_video = True
+            if tag.tag == "audio" or ext in AUDIO_EXT:
+                is_video = False
+                
+            yield {
+                'title': os.path.basename(path) or "Unknown File",
+                'url': file_url,
+                'is_video': is_video
+            }
+
+
+def _scrape_media_links(blocks, base_url):
+    """
+    Parse page blocks as they arrive; stop once MAX_SCRAPED_ITEMS links
+    are found (logged, so truncated listings don't go unnoticed).
+    The caller owns `blocks` and closes the response.
+    """
+    import lxml.etree
+
+    found = []
+    truncated = False
+    parser = lxml.etree.HTMLPullParser(events=("start",), tag=MEDIA_TAGS)
+
+    for chunk in blocks:
+        parser.feed(chunk)
+        found.extend(_scrape_events(parser, base_url))
+        if len(found) >= MAX_SCRAPED_ITEMS:
+            truncated = True
+            break
+
+    # Also on an early stop, so the parser never stays open mid-document
+    try:
+        parser.close()
+    except lxml.etree.LxmlError:
+        pass
+
+    if truncated:
+        del found[MAX_SCRAPED_ITEMS:]
+        logger.warning(
+            f"[DISCOVER] Listing truncated at {MAX_SCRAPED_ITEMS} links: {base_url}"
+        )
+    else:
+        found.extend(_scrape_events(parser, base_url))
+
+    return found
+
+
+# Apache / nginx / lighttpd autoindex pages: plain links, nothing for yt-dlp
+AUTOINDEX_RE = re.compile(rb"<(?:title|h1)>\s*Index of ", re.IGNORECASE)
+
+
+SCRAPE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
+}
+
+STT_SERVICES = {
+    STTModelChoices.EBOO: EbooService,
+    STTModelChoices.SCRIBE: ScribeService,
+    STTModelChoices.VIRA: ViraService,
+}
+
+
+# Seconds before a runaway extractor is interrupted (hard kill 30s later)
+DISCOVER_TIME_LIMIT = int(os.getenv("DISCOVER_TIME_LIMIT", "120"))
+
+# Parallel chunk uploads per task (provider rate limits apply)
+STT_CHUNK_WORKERS = int(os.getenv("STT_CHUNK_WORKERS", "4"))
+
+
+def _transcribe_chunk(service, model, stream_video, total, item):
+    idx, chunk_path = item
+    logger.info(f"[CHUNK] {idx + 1}/{total} processing")
+
+    if service is None:
+        result = {"error": f"Unknown model: {model}"}
+    elif stream_video:
+        wav_name = os.path.splitext(os.path.basename(chunk_path))[0] + ".wav"
+        with MediaService.extract_audio_stream(chunk_path) as audio_stream:
+            result = service.process_stream(audio_stream, wav_name)
+    else:
+        result = service.process(chunk_path)
+
+    if not result or "error" in result or "exception" in result:
+        logger.error(f"[CHUNK FAILED] skipping chunk: {result}")
+        return ""
+
+    return (result.get("text") or "").strip()
 
-# core/tasks.py
 
 @shared_task(bind=True)
 def process_audio_file(self, file_id):
@@ -56,25 +219,45 @@ def process_audio_file(self, file_id):
     logger.info(f"[TASK START] file_id={file_id}")
 
     audio_file = None
+    claimed = False
     extracted_audio_path = None
     temp_path = None  
+    # Everything this task creates on disk; removed in `finally`
+    temp_files = []
 
     try:
         # ---------------------------------------------------------
         # 1. Load DB record
         # ---------------------------------------------------------
-        try:
-            audio_file = AudioFile.objects.get(id=file_id)
-        except AudioFile.DoesNotExist:
-            logger.error(f"[ERROR] AudioFile {file_id} not found.")
-            return 
-
         # ---------------------------------------------------------
-        # 2. Track task + set PROCESSING
+        # 2. Claim: track task + set PROCESSING
+        # The row lock plus the owner check keep a redelivered or
+        # duplicate task from processing a file twice.
         # ---------------------------------------------------------
-        audio_file.task_id = self.request.id
-        audio_file.status = AudioFile.Status.PROCESSING
-        audio_file.save(update_fields=["task_id", "status"])
+        with transaction.atomic():
+            audio_file = (
+                AudioFile.objects
+                .select_for_update()
+                .filter(id=file_id)
+                .first()
+            )
+            if audio_file is None:
+                logger.error(f"[ERROR] AudioFile {file_id} not found.")
+                return
+
+            owner = audio_file.task_id
+            if audio_file.status == AudioFile.Status.COMPLETED or (
+                audio_file.status == AudioFile.Status.PROCESSING
+                and owner and owner != self.request.id
+            ):
+                logger.warning(f"[SKIP] File {file_id} already {audio_file.status} (task {owner}).")
+                audio_file = None
+                return
+
+            audio_file.task_id = self.request.id
+            audio_file.status = AudioFile.Status.PROCESSING
+            audio_file.save(update_fields=["task_id", "status", "updated_at"])
+            claimed = True
 
         logger.info(f"[STATUS] File {file_id} -> PROCESSING")
 
@@ -91,6 +274,7 @@ def process_audio_file(self, file_id):
             try:
                 logger.info(f"[IMPORT] Downloading from URL: {audio_file.source_url}")
                 temp_path = download_temp_file(audio_file.source_url)
+                temp_files.append(temp_path)
                 file_path = temp_path
             except Exception as e:
                 logger.error(f"[IMPORT ERROR] {e}", exc_info=True)
@@ -103,65 +287,60 @@ def process_audio_file(self, file_id):
         else:
             audio_file.status = AudioFile.Status.FAILED
             audio_file.error_message = "هیچ منبع فایلی یافت نشد."
-            audio_file.save()
+            audio_file.save(update_fields=["status", "error_message"])
             raise Exception("No source file")
 
+        model = audio_file.model_name or STTModelChoices.EBOO
+        max_chunk = MAX_CHUNK_SECONDS.get(model, 480)
+
         # ---------------------------------------------------------
         # 4. Video → extract audio
+        # Short videos need no chunking: their audio is piped from
+        # ffmpeg straight into the upload instead of a temp WAV.
         # ---------------------------------------------------------
+        stream_video = False
+        duration = get_audio_duration(file_path)
+
         if audio_file.is_video:
-            logger.info(f"[VIDEO] Extracting audio for file {file_id}")
-            try:
-                extracted_audio_path = MediaService.extract_audio(file_path)
-                file_path = extracted_audio_path
-            except Exception as ve:
-                logger.error(f"[VIDEO ERROR] {ve}", exc_info=True)
-                audio_file.status = AudioFile.Status.FAILED
-                audio_file.error_message = HUMAN_ERRORS["video"]
-                audio_file.save(update_fields=["status", "error_message"])
-                return  
+            if 1.0 <= duration <= max_chunk:
+                logger.info(f"[VIDEO] Streaming audio for file {file_id}")
+                stream_video = True
+            else:
+                logger.info(f"[VIDEO] Extracting audio for file {file_id}")
+                try:
+                    extracted_audio_path = MediaService.extract_audio(file_path)
+                    temp_files.append(extracted_audio_path)
+                    file_path = extracted_audio_path
+                    duration = get_audio_duration(file_path)
+                except Exception as ve:
+                    logger.error(f"[VIDEO ERROR] {ve}", exc_info=True)
+                    audio_file.status = AudioFile.Status.FAILED
+                    audio_file.error_message = HUMAN_ERRORS["video"]
+                    audio_file.save(update_fields=["status", "error_message"])
+                    return  
             
             
             
         # ---------------------------------------------------------
         # 4.5 Decide chunking 
+        # The splitter reports each chunk's duration, so nothing
+        # below needs to probe the chunk files again.
         # ---------------------------------------------------------
-        def get_audio_duration(path):
-            cmd = [
-                "ffprobe",
-                "-v", "error",
-                "-show_entries", "format=duration",
-                "-of", "default=noprint_wrappers=1:nokey=1",
-                path
-            ]
-            r = subprocess.run(cmd, capture_output=True, text=True)
-            try:
-                return float(r.stdout.strip())
-            except:
-                return 0.0
-
-        duration = get_audio_duration(file_path)
-
-        MAX_CHUNK_SECONDS = {
-            AudioFile.ModelChoices.VIRA: 300,   
-            AudioFile.ModelChoices.EBOO: 480,
-            AudioFile.ModelChoices.SCRIBE: 600,
-        }
-
-        model = audio_file.model_name or AudioFile.ModelChoices.EBOO
-        max_chunk = MAX_CHUNK_SECONDS.get(model, 480)
-
         if duration > max_chunk:
             logger.info(f"[CHUNKING] Long file detected ({int(duration)}s), max_chunk={max_chunk}s")
 
-            chunks = MediaService.smart_split_audio(
+            splits = MediaService.smart_split_audio(
                 file_path,
                 max_chunk_sec=max_chunk,
                 min_chunk_sec=60
             )
+            temp_files.extend(c for c, _ in splits)
 
         else:
-            chunks = [file_path]
+            splits = [(file_path, duration)]
+
+        chunks = [c for c, _ in splits]
+        durations = dict(splits)
             
             
             
@@ -175,14 +354,11 @@ def process_audio_file(self, file_id):
                 logger.warning(f"[CHUNK DROP] file not found: {c}")
                 continue
 
-            dur = get_audio_duration(c)
+            dur = durations[c]
 
             if dur < 1.0:
+                # Still in temp_files, so the finally block removes it
                 logger.warning(f"[CHUNK DROP] empty/short chunk: {c} ({dur}s)")
-                try:
-                    os.remove(c)
-                except:
-                    pass
                 continue
 
             valid_chunks.append(c)
@@ -202,40 +378,24 @@ def process_audio_file(self, file_id):
         # ---------------------------------------------------------
         # 5. Select AI service
         # ---------------------------------------------------------
-        model = audio_file.model_name or AudioFile.ModelChoices.EBOO
+        model = audio_file.model_name or STTModelChoices.EBOO
         logger.debug(f"[AI SERVICE] model={model} file={file_path}")
 
-        texts = []
+        service = STT_SERVICES.get(model)
+        transcribe = partial(_transcribe_chunk, service, model, stream_video, len(chunks))
 
-        for idx, chunk_path in enumerate(chunks):
-            chunk_duration = get_audio_duration(chunk_path)
-            if chunk_duration < 1.0:
-                logger.warning(f"[SKIP] chunk too short for processing: {chunk_path}")
-                continue
-
-            logger.info(f"[CHUNK] {idx + 1}/{len(chunks)} processing")
-
-            try:
-                if model == AudioFile.ModelChoices.EBOO:
-                    result = EbooService.process(chunk_path)
-                elif model == AudioFile.ModelChoices.SCRIBE:
-                    result = ScribeService.process(chunk_path)
-                elif model == AudioFile.ModelChoices.VIRA:
-                    result = ViraService.process(chunk_path)
-                else:
-                    result = {"error": f"Unknown model: {model}"}
-
-            except Exception as api_err:
-                raise api_err
-
-            if not result or "error" in result or "exception" in result:
-                logger.error(f"[CHUNK FAILED] skipping chunk: {result}")
-                continue
-
-
-            chunk_text = (result.get("text") or "").strip()
-            if chunk_text:
-                texts.append(chunk_text)
+        # Chunks are independent uploads: run a few at once, keep order.
+        workers = max(1, min(len(chunks), STT_CHUNK_WORKERS))
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                texts = [t for t in pool.map(transcribe, enumerate(chunks)) if t]
+        except CalledProcessError as ve:
+            # Only the streamed-video path runs ffmpeg here
+            logger.error(f"[VIDEO ERROR] {ve}", exc_info=True)
+            audio_file.status = AudioFile.Status.FAILED
+            audio_file.error_message = HUMAN_ERRORS["video"]
+            audio_file.save(update_fields=["status", "error_message"])
+            return
 
 
 
@@ -262,35 +422,21 @@ def process_audio_file(self, file_id):
         audio_file.transcript_text = final_text
         audio_file.status = AudioFile.Status.COMPLETED
         audio_file.error_message = None
-        audio_file.save()
+        audio_file.save(update_fields=["transcript_text", "status", "error_message"])
         
         # -----------------------------------------
         # 8. Summarize final text
+        # Runs as its own task (on the "summaries" queue) so this
+        # worker slot and the user's queue move on right away.
         # -----------------------------------------
         try:
-            logger.info(f"[SUMMARY] Starting summary for file_id={file_id}")
-
-            summary = SummaryService.summarize(final_text)
-
-            if summary:
-                audio_file.summary_text = summary
-                audio_file.show_summary = True
-                audio_file.save(update_fields=["summary_text", "show_summary"])
-
-                logger.info(f"[SUMMARY] Summary saved for file_id={file_id}")
-
-            else:
-                logger.warning(f"[SUMMARY] Empty summary returned for file_id={file_id}")
-
+            summarize_audio_file.delay(file_id)
         except Exception as e:
             logger.warning(
                 f"[SUMMARY FAILED] file_id={file_id} err={e}",
                 exc_info=True
             )
 
-                
-        
-
         logger.info(f"[TASK DONE] File {file_id} COMPLETED")
 
     except Exception as e:
@@ -298,133 +444,168 @@ def process_audio_file(self, file_id):
         if audio_file and audio_file.status != AudioFile.Status.FAILED:
             audio_file.status = AudioFile.Status.FAILED
             audio_file.error_message = HUMAN_ERRORS["unknown"]
-            audio_file.save()
+            audio_file.save(update_fields=["status", "error_message"])
 
     finally:
         # ---------------------------------------------------------
-        # A. Cleanup temp files
+        # A. Cleanup temp files and audio chunks
         # ---------------------------------------------------------
-        if extracted_audio_path and os.path.exists(extracted_audio_path):
+        for tmp in temp_files:
             try:
-                os.remove(extracted_audio_path)
-                logger.info(f"[CLEANUP] Temp audio removed: {extracted_audio_path}")
+                os.remove(tmp)
+                logger.info(f"[CLEANUP] Temp file removed: {tmp}")
+            except FileNotFoundError:
+                pass
             except Exception as ce:
-                logger.warning(f"[CLEANUP ERROR] {ce}")
-
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-                logger.info(f"[CLEANUP] Temp file deleted: {temp_path}")
-            except Exception:
-                logger.warning("[CLEANUP] Failed to delete temp file", exc_info=True)
-                
-        # ---------------------------------------------------------
-        # A.5 Cleanup audio chunks
-        # ---------------------------------------------------------
-        if 'chunks' in locals() and len(chunks) > 1:
-            for c in chunks:
-                if c != file_path and os.path.exists(c):
-                    try:
-                        os.remove(c)
-                        logger.info(f"[CLEANUP] Chunk removed: {c}")
-                    except Exception as ce:
-                        logger.warning(f"[CLEANUP] Failed to remove chunk: {ce}")        
+                logger.warning(f"[CLEANUP ERROR] {tmp}: {ce}")
 
         # ---------------------------------------------------------
         # B. USER-LEVEL QUEUE (Logic moved INSIDE finally)
         # ---------------------------------------------------------
         try:
  
-            current_user_id = None
-            if audio_file:
-                current_user_id = audio_file.user_id
-            else:
-                try:
-                    current_user_id = AudioFile.objects.values_list('user_id', flat=True).get(id=file_id)
-                except:
-                    pass
+            # Only the task that owned this file hands the user's queue on
+            current_user_id = audio_file.user_id if claimed else None
 
             if current_user_id:
-                other_active_tasks = AudioFile.objects.filter(
-                    user_id=current_user_id,
-                    status=AudioFile.Status.PROCESSING
-                ).exclude(id=file_id).exists()
-
-                if not other_active_tasks:
-                    next_file = (
-                        AudioFile.objects
-                        .filter(user_id=current_user_id, status=AudioFile.Status.PENDING)
-                        .order_by("created_at")
-                        .first()
-                    )
-
-                    if next_file:
-                        logger.info(f"[QUEUE] Starting next file for user {current_user_id}: {next_file.id}")
-                        
-
-                        next_file.status = AudioFile.Status.PROCESSING
-                        next_file.save(update_fields=["status"])
-
-                        task = process_audio_file.delay(next_file.id)
-                        
-                        next_file.task_id = task.id
-                        next_file.save(update_fields=["task_id"])
+                next_id = start_next_for_user(current_user_id, exclude_id=file_id)
+
+                if next_id:
+                    logger.info(f"[QUEUE] Started next file for user {current_user_id}: {next_id}")
                 else:
-                    logger.info(f"[QUEUE] User {current_user_id} has other active tasks. Skipping queue trigger.")
+                    logger.info(f"[QUEUE] User {current_user_id} busy or nothing pending. Skipping queue trigger.")
 
         except Exception as q_err:
             logger.error(f"[QUEUE ERROR] {q_err}", exc_info=True)
 
+@shared_task
+def summarize_audio_file(file_id):
+    try:
+        final_text = AudioFile.objects.values_list("transcript_text", flat=True).get(id=file_id)
+    except AudioFile.DoesNotExist:
+        return
+
+    try:
+        logger.info(f"[SUMMARY] Starting summary for file_id={file_id}")
+
+        summary = SummaryService.summarize(final_text)
+
+        if summary:
+            AudioFile.objects.filter(id=file_id).update(
+                summary_text=summary,
+                show_summary=True,
+            )
+            logger.info(f"[SUMMARY] Summary saved for file_id={file_id}")
+
+        else:
+            logger.warning(f"[SUMMARY] Empty summary returned for file_id={file_id}")
+
+    except Exception as e:
+        logger.warning(
+            f"[SUMMARY FAILED] file_id={file_id} err={e}",
+            exc_info=True
+        )
+
+
 # ======================================================================
 # SYSTEM TASKS
 # ======================================================================
 
-@shared_task
+# Idempotent scheduling work: a lost delivery is repeated by the next
+# run, so ack on receipt and skip the result-backend write.
+@shared_task(ignore_result=True, acks_late=False)
 def recover_stuck_tasks():
     from core.task_monitor import check_and_recover_stuck_tasks
     check_and_recover_stuck_tasks()
 
 
-@shared_task
-def start_next_pending_jobs():
+def start_next_for_user(user_id, exclude_id=None, producer=None):
     """
-    Auto-run next pending job for each user if no active processing.
+    Claim the user's oldest PENDING file, dispatch it and return its id,
+    unless the user already has a file PROCESSING. Locking the user row makes the
+    check-then-claim atomic per user, so two finishing tasks (or the
+    beat job) cannot both start a file for the same user.
     """
+    with transaction.atomic():
+        User.objects.select_for_update().filter(pk=user_id).first()
 
-    users = AudioFile.objects.values_list("user", flat=True).distinct()
-
-    for user_id in users:
-        has_processing = AudioFile.objects.filter(
+        busy = AudioFile.objects.filter(
             user_id=user_id,
             status=AudioFile.Status.PROCESSING,
-        ).exists()
+        )
+        if exclude_id is not None:
+            busy = busy.exclude(id=exclude_id)
 
-        if has_processing:
-            continue
+        if busy.exists():
+            return None
 
-        next_pending = (
+        next_id = (
             AudioFile.objects
+            .select_for_update(skip_locked=True)
             .filter(user_id=user_id, status=AudioFile.Status.PENDING)
             .order_by("created_at")
+            .values_list("id", flat=True)
             .first()
         )
+        if next_id is None:
+            return None
 
-        if next_pending:
-            task = process_audio_file.delay(next_pending.id)
-            next_pending.task_id = task.id
-            next_pending.save(update_fields=["task_id"])
+        task_id = uuid()
+        AudioFile.objects.filter(pk=next_id).update(
+            status=AudioFile.Status.PROCESSING,
+            task_id=task_id,
+            # .update() skips auto_now; recovery's cutoff reads this
+            updated_at=timezone.now(),
+        )
 
+        # Publish only once the claim is visible to the worker, even
+        # when the caller wraps us in its own transaction.
+        transaction.on_commit(partial(
+            process_audio_file.apply_async,
+            (next_id,), task_id=task_id, producer=producer,
+        ))
 
+    return next_id
 
 
-logger = logging.getLogger("core")
+@shared_task(ignore_result=True, acks_late=False)
+def start_next_pending_jobs():
+    """
+    Auto-run next pending job for each user if no active processing.
+    One query finds the idle users that have PENDING files; each is
+    then claimed under the per-user lock and published over a single
+    shared producer.
+    """
 
-@shared_task(bind=True)
+    busy_users = AudioFile.objects.filter(
+        status=AudioFile.Status.PROCESSING,
+    ).values("user")
+
+    idle_users = (
+        AudioFile.objects
+        .filter(status=AudioFile.Status.PENDING)
+        .exclude(user__in=busy_users)
+        .values_list("user", flat=True)
+        .distinct()
+    )
+
+    # Publish every dispatch over one broker connection
+    with process_audio_file.app.producer_or_acquire() as producer:
+        for user_id in list(idle_users):
+            start_next_for_user(user_id, producer=producer)
+
+
+@shared_task(
+    bind=True,
+    ignore_result=True,
+    soft_time_limit=DISCOVER_TIME_LIMIT,
+    time_limit=DISCOVER_TIME_LIMIT + 30,
+)
 def discover_link(self, batch_id):
     """
     Advanced discovery logic:
     1. Try yt-dlp (Best for embedded players, streaming, youtube, aparat, etc.)
-    2. Fallback to BeautifulSoup (Best for directory listings or simple HTML links)
+    2. Fallback to lxml HTML scraping (Best for directory listings or simple HTML links)
     """
     logger.info(f"[DISCOVER START] batch_id={batch_id}")
 
@@ -438,23 +619,29 @@ def discover_link(self, batch_id):
 
     found_items = []
 
+    # Sniff the first block of pages no site extractor claims: directory
+    # listings skip yt-dlp entirely, and the scrape fallback keeps reading
+    # the same response. YouTube, Aparat & co. go straight to yt-dlp.
+    page = None
+    head = b""
+    try:
+        if not _ydl_has_site_extractor(batch.source_url):
+            page = iter_page(batch.source_url, headers=SCRAPE_HEADERS)
+            head = next(page, b"")
+    except Exception as e:
+        logger.warning(f"[DISCOVER] Page sniff failed: {e}")
+        page = None
+
+    autoindex = AUTOINDEX_RE.search(head) is not None
+
     # =========================================================
     # STRATEGY 1: YT-DLP (The Heavy Lifter)
     # =========================================================
-    try:
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'ignoreerrors': True,
-            'extract_flat': 'in_playlist', 
-            'skip_download': True,
-            'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        }
-
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+    if not autoindex:
+        try:
             logger.info(f"[DISCOVER] Trying yt-dlp for {batch.source_url}")
-            info = ydl.extract_info(batch.source_url, download=False)
-            
+            info = _ydl_extract_info(batch.source_url)
+
             if info:
                 if 'entries' in info:
                     entries = info['entries']
@@ -463,12 +650,12 @@ def discover_link(self, batch_id):
 
                 for entry in entries:
                     if not entry: continue
-                    
+
                     # استخراج اطلاعات
                     title = entry.get('title') or "Untitled"
                     url = entry.get('url') or entry.get('webpage_url')
                     is_video = True # پیش‌فرض ویدیو می‌گیریم مگر اینکه خلافش ثابت شود
-                    
+
                     # تشخیص صوتی بودن اگر ممکن باشد
                     if entry.get('vcodec') == 'none' and entry.get('acodec') != 'none':
                         is_video = False
@@ -480,86 +667,78 @@ def discover_link(self, batch_id):
                             'is_video': is_video
                         })
 
-    except Exception as e:
-        logger.warning(f"[DISCOVER] yt-dlp failed or found nothing: {e}")
+        except SoftTimeLimitExceeded:
+            logger.error(f"[DISCOVER TIMEOUT] batch_id={batch_id}")
+            if page is not None:
+                page.close()
+            batch.status = ImportBatch.Status.FAILED
+            batch.error_message = HUMAN_ERRORS["timeout"]
+            batch.save(update_fields=["status", "error_message"])
+            return
+
+        except Exception as e:
+            logger.warning(f"[DISCOVER] yt-dlp failed or found nothing: {e}")
+    else:
+        logger.info(f"[DISCOVER] Directory listing detected, skipping yt-dlp")
 
     # =========================================================
-    # STRATEGY 2: BeautifulSoup (Fallback for Direct Links)
+    # STRATEGY 2: lxml HTML scrape (Fallback for Direct Links)
     # =========================================================
     if not found_items:
-        logger.info(f"[DISCOVER] Fallback to BeautifulSoup scraping...")
-        try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
-            }
-            resp = requests.get(batch.source_url, headers=headers, timeout=20, verify=False)
-            resp.raise_for_status()
-            
-            soup = BeautifulSoup(resp.text, "html.parser")
-            
-            AUDIO_EXT = (".mp3", ".wav", ".ogg", ".m4a", ".wma", ".aac", ".flac")
-            VIDEO_EXT = (".mp4", ".mkv", ".webm", ".avi", ".mov", ".wmv", ".flv", ".3gp", ".m3u8")
+        logger.info(f"[DISCOVER] Fallback to HTML scraping...")
+        if page is None:
+            page = iter_page(batch.source_url, headers=SCRAPE_HEADERS)
 
-            for tag in soup.find_all(["audio", "video", "source", "a", "iframe"]):
-                src = None
-                
-                if tag.name in ("audio", "video", "source"):
-                    src = tag.get("src")               
-                elif tag.name == "a":
-                    href = tag.get("href", "")
-                    if href and href.lower().endswith(AUDIO_EXT + VIDEO_EXT):
-                        src = href
-                        
-                if not src:
-                    continue
-
-                file_url = urljoin(batch.source_url, src)
-                
-                path = urlparse(file_url).path
-                ext = os.path.splitext(path)[1].lower()
-                
-                is_explicit_media_tag = tag.name in ("audio", "video", "source")
-                has_valid_ext = ext in (AUDIO_EXT + VIDEO_EXT)
-
-                if is_explicit_media_tag or has_valid_ext:
-                    is_video = True
-                    if tag.name == "audio" or ext in AUDIO_EXT:
-                        is_video = False
-                        
-                    found_items.append({
-                        'title': os.path.basename(path) or "Unknown File",
-                        'url': file_url,
-                        'is_video': is_video
-                    })
+        try:
+            found_items = _scrape_media_links(chain((head,), page), batch.source_url)
 
         except Exception as e:
             logger.error(f"[DISCOVER SCRAPE ERROR] {e}")
 
+        finally:
+            # Early stop (cap or error) must not leave the response open
+            page.close()
+
+    elif page is not None:
+        page.close()
+
     # =========================================================
     # SAVE RESULTS
     # =========================================================
-    saved_count = 0
-    unique_urls = set()
+    new_items = []
+    unique_urls = {item['url'] for item in found_items}
+
+    # One query for every URL this batch already has
+    seen = set(
+        ImportItem.objects
+        .filter(batch=batch, source_url__in=unique_urls)
+        .values_list('source_url', flat=True)
+    )
 
     for item in found_items:
         url = item['url']
-        
 
-        if url in unique_urls:
+        if url in seen:
             continue
-        unique_urls.add(url)
-        
+        seen.add(url)
 
-        if ImportItem.objects.filter(batch=batch, source_url=url).exists():
-            continue
+        new_items.append({
+            'title': item['title'][:250], 
+            'source_url': url,
+            'is_video': item['is_video']
+        })
 
-        ImportItem.objects.create(
-            batch=batch,
-            title=item['title'][:250], 
-            source_url=url,
-            is_video=item['is_video']
-        )
-        saved_count += 1
+    try:
+        ImportItem.bulk_from_discovery(batch, new_items)
+    except Exception as e:
+        logger.error(f"[DISCOVER SAVE ERROR] batch_id={batch_id}: {e}", exc_info=True)
+        batch.status = ImportBatch.Status.FAILED
+        batch.error_message = HUMAN_ERRORS["unknown"]
+        batch.save(update_fields=["status", "error_message"])
+        return
+
+    # Conflicting rows are skipped silently, so count what actually landed
+    saved_count = batch.items.count()
 
     if saved_count == 0:
         batch.status = ImportBatch.Status.FAILED
@@ -1,11 +1,24 @@
+from datetime import datetime
+from functools import lru_cache
+
 from django import template
 from django.utils import timezone  
 import jdatetime
 import os 
-import re
 
 register = template.Library()
 
+JALALI_FORMAT = "%H:%M - %Y/%m/%d"
+
+
+@lru_cache(maxsize=8192)
+def _jalali_minute(minute, tz):
+    # Output has minute precision, so every row created in the same
+    # minute shares one calendar conversion.
+    local_value = datetime.fromtimestamp(minute * 60, tz=tz)
+    return jdatetime.datetime.fromgregorian(datetime=local_value).strftime(JALALI_FORMAT)
+
+
 @register.filter
 def to_jalali(value):
     """
@@ -13,19 +26,14 @@ def to_jalali(value):
     """
     if value is None:
         return ""
-    
-
-    try:
-        local_value = timezone.localtime(value)
-    except Exception:
-
-        local_value = value
 
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return _jalali_minute(int(value.timestamp() // 60), timezone.get_current_timezone())
 
-    jalali_date = jdatetime.datetime.fromgregorian(datetime=local_value)
+    jalali_date = jdatetime.datetime.fromgregorian(datetime=value)
     
 
-    return jalali_date.strftime("%H:%M - %Y/%m/%d")
+    return jalali_date.strftime(JALALI_FORMAT)
 
 
 @register.filter
@@ -45,5 +53,8 @@ def clean_filename(file_path):
     """
     filename = os.path.basename(file_path)
     name, ext = os.path.splitext(filename)
-    clean_name = re.sub(r'_[a-zA-Z0-9]+$', '', name)
-    return f"{clean_name}{ext}"
+    # Same as re.sub(r'_[a-zA-Z0-9]+$', '', name) without the regex engine
+    head, sep, tail = name.rpartition('_')
+    if sep and tail.isascii() and tail.isalnum():
+        name = head
+    return f"{name}{ext}"
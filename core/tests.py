@@ -1,3 +1,335 @@
-from django.test import TestCase
+import os
+import struct
+import tempfile
+import wave
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from . import tasks
+from .models import AudioFile
+from .services import MediaService, _wav_duration_fast, _wav_pcm_layout
+
+
+def _riff(*chunks):
+    """RIFF/WAVE file body from (chunk id, payload) pairs, in order."""
+    body = b"WAVE"
+    for cid, payload in chunks:
+        body += struct.pack("<4sI", cid, len(payload)) + payload
+        if len(payload) & 1:
+            body += b"\0"
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+def _fmt(tag=1, channels=1, rate=16000, bits=16):
+    block = channels * bits // 8
+    return struct.pack("<HHIIHH", tag, channels, rate, rate * block, block, bits)
+
+
+class WavLayoutTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_plain_44_byte_header(self):
+        pcm = b"\1\0" * 16000
+        path = self.write("a.wav", _riff((b"fmt ", _fmt()), (b"data", pcm)))
+
+        self.assertEqual(_wav_pcm_layout(path), (44, len(pcm), 1, 16000, 16))
+        self.assertEqual(_wav_duration_fast(path), 1.0)
+
+    def test_list_chunk_before_data(self):
+        # ffmpeg writes a LIST/INFO chunk; odd sizes are padded to even
+        pcm = b"\0\0" * 8000
+        path = self.write("b.wav", _riff(
+            (b"fmt ", _fmt()),
+            (b"LIST", b"INFOISFT\x05\0\0\0Lavf\0"),
+            (b"data", pcm),
+        ))
+
+        offset, size, ch, sr, bits = _wav_pcm_layout(path)
+        self.assertEqual(offset, 44 + 8 + 18)
+        self.assertEqual((size, ch, sr, bits), (len(pcm), 1, 16000, 16))
+        self.assertEqual(_wav_duration_fast(path), 0.5)
+
+    def test_streamed_wav_with_unset_data_size(self):
+        # Piped ffmpeg output leaves the data size at 0 / 0xFFFFFFFF
+        pcm = b"\0\0" * 1600
+        data = bytearray(_riff((b"fmt ", _fmt()), (b"data", pcm)))
+        struct.pack_into("<I", data, 40, 0xFFFFFFFF)
+        path = self.write("c.wav", bytes(data))
+
+        self.assertEqual(_wav_pcm_layout(path)[1], len(pcm))
+
+    def test_non_pcm_rejected(self):
+        # IEEE float (tag 3)
+        path = self.write("f.wav", _riff((b"fmt ", _fmt(tag=3, bits=32)), (b"data", b"\0" * 64)))
+        self.assertIsNone(_wav_pcm_layout(path))
+        self.assertIsNone(_wav_duration_fast(path))
+
+    def test_not_riff_rejected(self):
+        path = self.write("x.wav", b"ID3\x04" + b"\0" * 60)
+        self.assertIsNone(_wav_pcm_layout(path))
+
+    def test_data_before_fmt_rejected(self):
+        path = self.write("d.wav", _riff((b"data", b"\0" * 8), (b"fmt ", _fmt())))
+        self.assertIsNone(_wav_pcm_layout(path))
+
+
+class SlicePcmWavTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_byte_ranges_and_headers(self):
+        # Sample i holds i, so every slice's first/last sample is known
+        samples = list(range(3 * 16000))
+        pcm = struct.pack(f"<{len(samples)}h", *[s % 32768 for s in samples])
+        src = os.path.join(self.tmp.name, "src.wav")
+        with open(src, "wb") as f:
+            f.write(_riff((b"fmt ", _fmt()), (b"LIST", b"INFO"), (b"data", pcm)))
+
+        layout = _wav_pcm_layout(src)
+        pattern = os.path.join(self.tmp.name, "out_%03d.wav")
+        MediaService._slice_pcm_wav(src, layout, [(0, 1.25), (1.25, 2.5), (2.5, None)], pattern)
+
+        expected = [(0, 20000), (20000, 40000), (40000, 48000)]
+        for i, (first, end) in enumerate(expected):
+            path = pattern % i
+            with wave.open(path, "rb") as w:
+                self.assertEqual(w.getnchannels(), 1)
+                self.assertEqual(w.getsampwidth(), 2)
+                self.assertEqual(w.getframerate(), 16000)
+                self.assertEqual(w.getnframes(), end - first)
+                frames = w.readframes(w.getnframes())
+
+            self.assertEqual(frames, pcm[first * 2:end * 2])
+
+            # Rewritten header sizes match the slice, not the source
+            out_layout = _wav_pcm_layout(path)
+            self.assertEqual(out_layout, (44, (end - first) * 2, 1, 16000, 16))
+            with open(path, "rb") as f:
+                riff_size = struct.unpack("<I", f.read(8)[4:])[0]
+            self.assertEqual(riff_size, os.path.getsize(path) - 8)
+
+    def test_cut_past_end_is_clamped(self):
+        pcm = b"\0\0" * 16000
+        src = os.path.join(self.tmp.name, "src.wav")
+        with open(src, "wb") as f:
+            f.write(_riff((b"fmt ", _fmt()), (b"data", pcm)))
+
+        pattern = os.path.join(self.tmp.name, "out_%03d.wav")
+        MediaService._slice_pcm_wav(src, _wav_pcm_layout(src), [(0.5, 5.0), (9.0, None)], pattern)
+
+        with wave.open(pattern % 0, "rb") as w:
+            self.assertEqual(w.getnframes(), 8000)
+        with wave.open(pattern % 1, "rb") as w:
+            self.assertEqual(w.getnframes(), 0)
+
+
+class PcmSilenceTests(SimpleTestCase):
+
+    RATE = 16000
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def tone(self, seconds, db=-6.0):
+        t = np.arange(int(seconds * self.RATE)) / self.RATE
+        return 32767 * 10 ** (db / 20) * np.sin(2 * np.pi * 440 * t)
+
+    def silence(self, seconds):
+        return np.zeros(int(seconds * self.RATE))
+
+    def ends(self, *parts, silence_db=-35, silence_dur=0.6):
+        pcm = np.concatenate(parts).astype("<i2").tobytes()
+        path = os.path.join(self.tmp.name, "s.wav")
+        with open(path, "wb") as f:
+            f.write(_riff((b"fmt ", _fmt()), (b"LIST", b"INFO"), (b"data", pcm)))
+        return MediaService._pcm_silence_ends(
+            path, _wav_pcm_layout(path), silence_db, silence_dur
+        )
+
+    def test_tone_silence_tone(self):
+        ends = self.ends(
+            self.tone(1), self.silence(1),
+            self.tone(1), self.silence(0.3),   # too short to count
+            self.tone(1), self.silence(0.8),   # trailing, ends with the file
+        )
+        self.assertEqual(len(ends), 2)
+        self.assertAlmostEqual(ends[0], 2.0, places=2)
+        self.assertAlmostEqual(ends[1], 5.1, places=2)
+
+    def test_threshold(self):
+        # -50 dB hiss is silence at -35 dB; a -30 dB tone is not
+        ends = self.ends(
+            self.tone(1), self.tone(1, db=-50),
+            self.tone(1), self.tone(1, db=-30),
+            self.tone(1),
+        )
+        self.assertEqual(len(ends), 1)
+        self.assertAlmostEqual(ends[0], 2.0, places=2)
+
+    def test_silence_across_block_boundary(self):
+        # Frames are scored 60 s at a time; a gap over the seam is one silence
+        ends = self.ends(self.tone(59.5), self.silence(1), self.tone(1))
+        self.assertEqual(len(ends), 1)
+        self.assertAlmostEqual(ends[0], 60.5, places=2)
+
+    def test_no_silence(self):
+        self.assertEqual(self.ends(self.tone(3)), [])
+
+
+class StartNextForUserTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("u1")
+        patcher = mock.patch.object(tasks.process_audio_file, "apply_async")
+        self.apply_async = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_file(self, status, minutes_ago=0, user=None):
+        af = AudioFile.objects.create(user=user or self.user, title="f", status=status)
+        AudioFile.objects.filter(pk=af.pk).update(
+            created_at=timezone.now() - timedelta(minutes=minutes_ago)
+        )
+        return af
+
+    def start(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return tasks.start_next_for_user(self.user.id, **kwargs)
+
+    def test_claims_oldest_pending(self):
+        newer = self.add_file(AudioFile.Status.PENDING, minutes_ago=1)
+        older = self.add_file(AudioFile.Status.PENDING, minutes_ago=5)
+
+        self.assertEqual(self.start(), older.id)
+
+        older.refresh_from_db()
+        newer.refresh_from_db()
+        self.assertEqual(older.status, AudioFile.Status.PROCESSING)
+        self.assertTrue(older.task_id)
+        self.assertEqual(newer.status, AudioFile.Status.PENDING)
+        self.apply_async.assert_called_once_with(
+            (older.id,), task_id=older.task_id, producer=None
+        )
+
+    def test_no_second_job_while_one_is_processing(self):
+        self.add_file(AudioFile.Status.PROCESSING)
+        pending = self.add_file(AudioFile.Status.PENDING)
+
+        self.assertIsNone(self.start())
+
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, AudioFile.Status.PENDING)
+        self.apply_async.assert_not_called()
+
+    def test_exclude_id_ignores_the_finishing_file(self):
+        finishing = self.add_file(AudioFile.Status.PROCESSING)
+        pending = self.add_file(AudioFile.Status.PENDING)
+
+        self.assertEqual(self.start(exclude_id=finishing.id), pending.id)
+        self.apply_async.assert_called_once()
+
+    def test_exclude_id_does_not_hide_other_processing_files(self):
+        finishing = self.add_file(AudioFile.Status.PROCESSING)
+        self.add_file(AudioFile.Status.PROCESSING)
+        self.add_file(AudioFile.Status.PENDING)
+
+        self.assertIsNone(self.start(exclude_id=finishing.id))
+        self.apply_async.assert_not_called()
+
+    def test_other_users_do_not_block(self):
+        other = User.objects.create_user("u2")
+        self.add_file(AudioFile.Status.PROCESSING, user=other)
+        pending = self.add_file(AudioFile.Status.PENDING)
+
+        self.assertEqual(self.start(), pending.id)
+
+    def test_nothing_pending(self):
+        self.add_file(AudioFile.Status.COMPLETED)
+
+        self.assertIsNone(self.start())
+        self.apply_async.assert_not_called()
+
+
+class ScrapeMediaLinksTests(SimpleTestCase):
+
+    BASE = "https://example.com/music/index.html"
+
+    def scrape(self, html, block=64):
+        # Small blocks, so tags are split across feed() calls
+        data = html.encode()
+        return tasks._scrape_media_links(
+            (data[i:i + block] for i in range(0, len(data), block)), self.BASE
+        )
+
+    def test_relative_links_resolved(self):
+        found = self.scrape(
+            '<a href="a.mp3">A</a>'
+            '<a href="/video/b.MP4">B</a>'
+            '<a href="https://cdn.example.org/c.ogg?sig=1">C</a>'
+        )
+        self.assertEqual(found, [
+            {'title': 'a.mp3', 'url': 'https://example.com/music/a.mp3', 'is_video': False},
+            {'title': 'b.MP4', 'url': 'https://example.com/video/b.MP4', 'is_video': True},
+            {'title': 'c.ogg', 'url': 'https://cdn.example.org/c.ogg?sig=1', 'is_video': False},
+        ])
+
+    def test_non_media_links_skipped(self):
+        found = self.scrape(
+            '<a href="../">Parent</a><a href="notes.txt">t</a>'
+            '<a href="page.html">p</a><a>no href</a>'
+            '<a href="song.mp3">s</a>'
+        )
+        self.assertEqual([f['title'] for f in found], ['song.mp3'])
+
+    def test_media_tags_kept_whatever_the_extension(self):
+        found = self.scrape(
+            '<audio src="stream"></audio>'
+            '<video><source src="clip.php?id=3"></video>'
+        )
+        self.assertEqual(
+            [(f['url'], f['is_video']) for f in found],
+            [('https://example.com/music/stream', False),
+             ('https://example.com/music/clip.php?id=3', True)],
+        )
+
+    def test_cap(self):
+        html = "".join(f'<a href="{i}.mp3">{i}</a>' for i in range(30))
+
+        with mock.patch.object(tasks, "MAX_SCRAPED_ITEMS", 10), \
+                self.assertLogs("core", level="WARNING") as logs:
+            found = self.scrape(html, block=200)
+
+        self.assertEqual(len(found), 10)
+        self.assertEqual(found[-1]['title'], '9.mp3')
+        self.assertIn(self.BASE, logs.output[0])
+
+    def test_cap_stops_reading(self):
+        blocks = iter([b'<a href="1.mp3"></a><a href="2.mp3"></a>', b'<a href="3.mp3"></a>'])
+
+        with mock.patch.object(tasks, "MAX_SCRAPED_ITEMS", 2), \
+                self.assertLogs("core", level="WARNING"):
+            found = tasks._scrape_media_links(blocks, self.BASE)
+
+        self.assertEqual(len(found), 2)
+        self.assertEqual(list(blocks), [b'<a href="3.mp3"></a>'])
+
+    def test_site_extractor_check(self):
+        # discover_link only sniffs pages that no site extractor claims
+        self.assertTrue(tasks._ydl_has_site_extractor("https://www.youtube.com/watch?v=dQw4w9WgXcQ"))
+        self.assertFalse(tasks._ydl_has_site_extractor("https://example.com/music/"))
@@ -1,13 +1,17 @@
 # core/views.py
 
+import logging
 import os
 import io
-import textwrap
+import re
+import tempfile
+from functools import lru_cache
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.http import (
+    FileResponse,
     HttpResponse,
     JsonResponse,
     HttpResponseBadRequest
@@ -21,11 +25,17 @@ import json
 
 from django.core.paginator import Paginator
 from django.template.loader import render_to_string
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    set_response_etag,
+)
 from django.conf import settings
+from django.db import transaction
 
 from .forms import AudioUploadForm, SignUpForm
 from .models import AudioFile, ImportBatch, ImportItem, STTModelChoices
-from .tasks import process_audio_file, discover_link
+from .tasks import discover_link, start_next_for_user
 
 # Word export
 from docx import Document
@@ -42,25 +52,32 @@ from bidi.algorithm import get_display
 
 from celery import current_app
 
+logger = logging.getLogger("core")
+
 
 # ---------------------------------------------------------
 # Utility Helpers
 # ---------------------------------------------------------
 
+# Every emoji is a single code point, so one str.translate pass covers all
+EXPORT_EMOJI_TABLE = str.maketrans({
+    '🕒': ' [زمان]: ',
+    '🎵': ' [موسیقی]: ',
+    '🆔': ' [گوینده]: ',
+    '✔': ' [تیک] ',
+    '⚠': ' [هشدار] ',
+})
+
+
 def clean_text_for_export(text):
     """Replaces emojis with export-safe text."""
     if not text:
         return ""
-    repl = {
-        '🕒': ' [زمان]: ',
-        '🎵': ' [موسیقی]: ',
-        '🆔': ' [گوینده]: ',
-        '✔': ' [تیک] ',
-        '⚠': ' [هشدار] ',
-    }
-    for k, v in repl.items():
-        text = text.replace(k, v)
-    return text
+    return text.translate(EXPORT_EMOJI_TABLE)
+
+
+# Anything but letters, digits, '_', ' ' and '-' (\w is isalnum() plus '_')
+UNSAFE_FILENAME_RE = re.compile(r"[^\w \-]+")
 
 
 def get_safe_filename(audio_file, ext):
@@ -69,13 +86,117 @@ def get_safe_filename(audio_file, ext):
         try:
             original = os.path.basename(audio_file.audio_file.name)
             name = os.path.splitext(original)[0]
-            clean = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).strip()
+            clean = UNSAFE_FILENAME_RE.sub("", name).strip()
             return f"{clean}.{ext}"
-        except:
+        except (AttributeError, TypeError, ValueError):
             pass
     return f"transcript_{audio_file.id}.{ext}"
 
 
+# Columns partials/row.html reads; keeps transcript_text out of polling
+FILE_ROW_FIELDS = (
+    "id", "title", "audio_file", "created_at", "model_name",
+    "status", "summary_text", "error_message",
+)
+
+
+def user_files_page(request):
+    """Current page (10 rows) of the user's files, newest first."""
+    files = (
+        AudioFile.objects
+        .filter(user=request.user)
+        .only(*FILE_ROW_FIELDS)
+        .order_by("-created_at")
+    )
+    paginator = Paginator(files, 10)
+    return paginator.get_page(request.GET.get("page"))
+
+
+# Exports bigger than this spill to a temp file instead of staying in RAM
+EXPORT_SPOOL_BYTES = 2 * 1024 * 1024
+
+
+def export_buffer():
+    """
+    Buffer for a generated DOCX/PDF. Returned via FileResponse, which
+    streams it in blocks with a Content-Length and closes it afterwards.
+    """
+    return tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+
+
+@lru_cache(maxsize=None)
+def docx_template_bytes():
+    """
+    python-docx's blank document, serialized once per process. Opening
+    it from memory skips locating and reading the template on disk.
+    """
+    buf = io.BytesIO()
+    Document().save(buf)
+    return buf.getvalue()
+
+
+_pdf_font_registered = False
+
+
+def pdf_font_name():
+    """
+    Registers the Persian PDF font on first use and returns its name.
+    Parsing the TTF is the slow part, so each process does it once;
+    a failed attempt falls back to Helvetica and is retried next time.
+    """
+    global _pdf_font_registered
+
+    if not _pdf_font_registered:
+        try:
+            path = os.path.join(settings.BASE_DIR, "core", "static", "fonts", "Vazir.ttf")
+            pdfmetrics.registerFont(TTFont("Vazir", path))
+        except Exception:
+            logger.exception("[PDF] Font registration failed; using Helvetica")
+            return "Helvetica"
+        _pdf_font_registered = True
+
+    return "Vazir"
+
+
+def wrap_to_width(text, font_name, font_size, max_width):
+    """
+    Greedy word wrap by rendered width (points) instead of character
+    count, so proportional Persian text fills each PDF line. Words wider
+    than a whole line are split by character, like textwrap does.
+    """
+    space_w = pdfmetrics.stringWidth(" ", font_name, font_size)
+    lines, line, line_w = [], [], 0.0
+
+    for word in text.split():
+        word_w = pdfmetrics.stringWidth(word, font_name, font_size)
+
+        if word_w > max_width:
+            if line:
+                lines.append(" ".join(line))
+                line, line_w = [], 0.0
+            piece, piece_w = "", 0.0
+            for ch in word:
+                ch_w = pdfmetrics.stringWidth(ch, font_name, font_size)
+                if piece and piece_w + ch_w > max_width:
+                    lines.append(piece)
+                    piece, piece_w = "", 0.0
+                piece += ch
+                piece_w += ch_w
+            line, line_w = [piece], piece_w
+            continue
+
+        if line and line_w + space_w + word_w > max_width:
+            lines.append(" ".join(line))
+            line, line_w = [], 0.0
+
+        line_w += word_w + (space_w if line else 0.0)
+        line.append(word)
+
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+
 # ---------------------------------------------------------
 # Landing + Authentication
 # ---------------------------------------------------------
@@ -108,10 +229,7 @@ def signup(request):
 @login_required
 def dashboard(request):
     """Main dashboard page."""
-    files = AudioFile.objects.filter(user=request.user).order_by("-created_at")
-    paginator = Paginator(files, 10)
-    page = request.GET.get("page")
-    page_obj = paginator.get_page(page)
+    page_obj = user_files_page(request)
 
     return render(request, "core/dashboard.html", {"files": page_obj})
 
@@ -175,39 +293,21 @@ def upload_file(request):
 
     # -------------------------------------------------
     # 4. Save uploaded file on SAME row
+    # (the form also sets is_video from the file name)
     # -------------------------------------------------
     audio = form.save(commit=False)
-
-    # -------------------------------------------------
-    # 5. Detect VIDEO file
-    # -------------------------------------------------
-    filename = (audio.audio_file.name or "").lower()
-    video_exts = (".mp4", ".mkv", ".avi", ".mov", ".webm")
-    audio.is_video = filename.endswith(video_exts)
-
+    audio.status = AudioFile.Status.PENDING
     audio.save()
 
     # -------------------------------------------------
-    # 6. Queue logic (one active job per user)
+    # 5. Queue logic (one active job per user)
+    # Checked and claimed under the user's row lock, so two
+    # parallel uploads cannot both start a job.
     # -------------------------------------------------
-    user_has_active_job = AudioFile.objects.filter(
-        user=request.user,
-        status__in=[
-            AudioFile.Status.PENDING,
-            AudioFile.Status.PROCESSING
-        ]
-    ).exclude(id=audio.id).exists()
-
-    audio.status = AudioFile.Status.PENDING
-    audio.save(update_fields=["status"])
-
-    if not user_has_active_job:
-        task = process_audio_file.delay(audio.id)
-        audio.task_id = task.id
-        audio.save(update_fields=["task_id"])
+    start_next_for_user(request.user.id)
 
     # -------------------------------------------------
-    # 7. Success response
+    # 6. Success response
     # -------------------------------------------------
     return JsonResponse(
         {
@@ -337,44 +437,39 @@ def enqueue_import_items(request):
         final_model = batch.model_name
 
 
-    items = ImportItem.objects.filter(
-        id__in=item_ids,
-        batch=batch
+    items = list(
+        ImportItem.objects
+        .filter(id__in=item_ids, batch=batch)
+        .only("title", "source_url", "is_video")
     )
 
-    if not items.exists():
+    if not items:
         return JsonResponse(
             {"success": False, "error": "آیتم معتبری یافت نشد."},
             status=400
         )
 
-    created_files = []
-
-    for item in items:
-        audio = AudioFile.objects.create(
-            user=request.user,
-            title=item.title or "Imported file",
-            source_url=item.source_url,
-            is_video=item.is_video,
+    # Rows and the queue claim commit together; the task is
+    # published after the commit.
+    with transaction.atomic():
+        # One INSERT for the whole selection
+        created_files = AudioFile.objects.bulk_create([
+            AudioFile(
+                user=request.user,
+                title=item.title or "Imported file",
+                source_url=item.source_url,
+                is_video=item.is_video,
             
-            model_name=final_model,  
+                model_name=final_model,  
             
-            status=AudioFile.Status.PENDING,
-            import_batch=batch,
-        )
-        created_files.append(audio)
+                status=AudioFile.Status.PENDING,
+                import_batch=batch,
+            )
+            for item in items
+        ], batch_size=500)
 
-    user_has_active_job = AudioFile.objects.filter(
-        user=request.user,
-        status=AudioFile.Status.PROCESSING
-    ).exists()
-
-    if created_files and not user_has_active_job:
-        first = created_files[0]
-        task = process_audio_file.delay(first.id)
-        first.task_id = task.id
-        first.status = AudioFile.Status.PROCESSING
-        first.save(update_fields=["task_id", "status"])
+        # Claims and publishes the user's oldest PENDING file, if idle
+        start_next_for_user(request.user.id)
 
     return JsonResponse({
         "success": True,
@@ -389,28 +484,42 @@ def enqueue_import_items(request):
 # AJAX — File list refresh for polling
 # ---------------------------------------------------------
 
+def polled_html(request, html):
+    """
+    HTML response for polling endpoints, tagged with an ETag of its
+    body. Clients must revalidate every time (no-cache), and an
+    unchanged table or row is answered with an empty 304.
+
+    The ETag hashes the rendered HTML rather than updated_at, since the
+    tasks' .update() and update_fields writes don't bump updated_at.
+    """
+    response = HttpResponse(html)
+    patch_cache_control(response, no_cache=True, private=True)
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response["ETag"], response=response)
+
+
 @login_required
 def get_files(request):
     """Returns updated table HTML for polling."""
-    files = AudioFile.objects.filter(user=request.user).order_by("-created_at")
-    paginator = Paginator(files, 10)
-    page = request.GET.get("page")
-    page_obj = paginator.get_page(page)
+    page_obj = user_files_page(request)
 
     html = render_to_string(
         "partials/file_table_container.html",
         {"files": page_obj},
         request=request
     )
-    return HttpResponse(html)
+    return polled_html(request, html)
 
 
 @login_required
 def update_row(request, file_id):
     """Returns HTML for a single table row."""
-    file = get_object_or_404(AudioFile, id=file_id, user=request.user)
+    file = get_object_or_404(
+        AudioFile.objects.only(*FILE_ROW_FIELDS), id=file_id, user=request.user
+    )
     html = render_to_string("partials/row.html", {"file": file}, request=request)
-    return HttpResponse(html)
+    return polled_html(request, html)
 
 
 # ---------------------------------------------------------
@@ -449,10 +558,21 @@ def delete_file(request, pk):
 # Downloads
 # ---------------------------------------------------------
 
+# Everything the exports and get_safe_filename read
+EXPORT_FIELDS = ("id", "title", "audio_file", "transcript_text")
+
+
+def get_export_file(request, file_id):
+    """The user's file with only the columns an export needs."""
+    return get_object_or_404(
+        AudioFile.objects.only(*EXPORT_FIELDS), id=file_id, user=request.user
+    )
+
+
 @login_required
 def download_txt(request, file_id):
     """Exports transcript as TXT."""
-    audio_file = get_object_or_404(AudioFile, id=file_id, user=request.user)
+    audio_file = get_export_file(request, file_id)
     raw = audio_file.transcript_text or "متنی موجود نیست."
     txt = clean_text_for_export(raw)
 
@@ -467,9 +587,9 @@ def download_txt(request, file_id):
 @login_required
 def download_word(request, file_id):
     """Exports transcript as a Word DOCX file."""
-    audio_file = get_object_or_404(AudioFile, id=file_id, user=request.user)
+    audio_file = get_export_file(request, file_id)
 
-    doc = Document()
+    doc = Document(io.BytesIO(docx_template_bytes()))
     title_p = doc.add_heading(audio_file.title or "متن استخراج شده", 0)
     title_p.alignment = WD_ALIGN_PARAGRAPH.RIGHT
 
@@ -486,11 +606,11 @@ def download_word(request, file_id):
                 r.font.name = "Arial"
                 r.font.size = Pt(12)
 
-    buf = io.BytesIO()
+    buf = export_buffer()
     doc.save(buf)
     buf.seek(0)
 
-    response = HttpResponse(
+    response = FileResponse(
         buf,
         content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
     )
@@ -502,20 +622,14 @@ def download_word(request, file_id):
 @login_required
 def download_pdf(request, file_id):
     """Exports transcript as PDF."""
-    audio_file = get_object_or_404(AudioFile, id=file_id, user=request.user)
+    audio_file = get_export_file(request, file_id)
 
-    buf = io.BytesIO()
+    buf = export_buffer()
     c = canvas.Canvas(buf, pagesize=A4)
     width, height = A4
     margin_x, margin_y = 50, 50
 
-    font_name = "Helvetica"
-    try:
-        path = os.path.join(settings.BASE_DIR, "core", "static", "fonts", "Vazir.ttf")
-        pdfmetrics.registerFont(TTFont("Vazir", path))
-        font_name = "Vazir"
-    except Exception as e:
-        print("Font error:", e)
+    font_name = pdf_font_name()
 
     c.setFont(font_name, 12)
 
@@ -530,12 +644,16 @@ def download_pdf(request, file_id):
             y -= line_h
             continue
 
-        lines = textwrap.wrap(paragraph, width=90)
+        # Letter shaping doesn't depend on where the line breaks,
+        # so shape the paragraph once; bidi reordering stays per line.
+        if font_name == "Vazir":
+            paragraph = arabic_reshaper.reshape(paragraph)
+
+        lines = wrap_to_width(paragraph, font_name, 12, width - 2 * margin_x)
 
         for l in lines:
             if font_name == "Vazir":
-                reshaped = arabic_reshaper.reshape(l)
-                bidi = get_display(reshaped)
+                bidi = get_display(l)
             else:
                 bidi = l
 
@@ -551,7 +669,7 @@ def download_pdf(request, file_id):
     c.save()
 
     buf.seek(0)
-    response = HttpResponse(buf, content_type="application/pdf")
+    response = FileResponse(buf, content_type="application/pdf")
     filename = get_safe_filename(audio_file, "pdf")
     response['Content-Disposition'] = f"attachment; filename*=UTF-8''{filename}"
     return response